@@ -1,85 +1,109 @@
-import customtkinter as ctk
-import sqlite3 as sql
-from datetime import datetime
+import bisect
+import sys
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
-from tksheet import Sheet
-import csv
+
+# Taken before the heavy imports so --profile-startup shows what they cost
+startup_started = time.perf_counter()
+
+import customtkinter as ctk  # noqa: E402
+from catalog import Catalog, clean_cell, search_avail, save_equipment, save_avail, rebuild_avail, save_students, save_imported_students  # noqa: E402
+from catalog import holder_at, holders_between, held_by, history_date  # noqa: E402
+from storage import Storage, default_station  # noqa: E402
+from session import ScanJournal, commit_rows, recover_journal  # noqa: E402
+from engine import Engine, ScanError  # noqa: E402
+from dbworker import DBWorker  # noqa: E402
+from scanner import ScanCapture  # noqa: E402
+
+#-----Startup Timeline-----#
+# Run with --profile-startup to print how long each phase of launching took,
+# from the first heavy import to the first idle moment of the event loop, and
+# the per-query timings of both connections on exit. A kiosk run without it
+# prints nothing.
+profile_startup = "--profile-startup" in sys.argv
+startup_timeline = []
+
+
+def mark_startup(phase):
+
+    startup_timeline.append((phase, time.perf_counter()))
+
+
+def print_startup_timeline():
+
+    previous = startup_started
+    for phase, moment in startup_timeline:
+        print(f"{phase:<24}{(moment - previous) * 1000:8.1f} ms {(moment - startup_started) * 1000:8.1f} ms total")
+        previous = moment
+
+
+mark_startup("imports")
+
 
 stu_csv_path = Path("Main") / "Students"
 eq_csv_path = Path("Main") / "Equipment"
 
-data_path = Path("Main") / ("DB") / "data.db"
+master_page_size = 200
+search_delay = 60
+avail_poll_interval = 1000
+status_hold = 8000
+
+
+def option(name, default=None):
+
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else default
+
+
+# Several kiosks can share one data.db; each names itself with --station
+# (default: the host name) and keeps its own scan journal
+station = option("--station", default_station)
+
+# --db points at the central data.db, e.g. on a network share. The journal,
+# outbox and replica always stay in local_path on this machine. A shared
+# data.db is opened without WAL, which only works on a single host (see
+# storage.py); stations that cannot reach the share reliably should use
+# --outbox or the API server instead.
+local_path = Path("Main") / ("DB")
+data_path = Path(option("--db", local_path / "data.db"))
+shared_db = "--db" in sys.argv
 data_uri = data_path.resolve().as_uri()
+journal_path = local_path / f"session.{station}.journal"
+
+# With --outbox finished sessions go to a file on local disk first and a
+# sync thread replays them into data.db, while scans read a local replica
+# of the catalog, so neither startup nor scanning waits on data.db (see
+# outbox.py). Admin screens still work on data.db itself.
+use_outbox = "--outbox" in sys.argv
+outbox_path = local_path / f"outbox.{station}.db"
+replica_path = local_path / f"replica.{station}.db"
+
+# Connections, threads and the journal are only set up when this file runs
+# as the program (see Start Program), so a process that merely imports it,
+# such as a roster parsing worker, opens nothing
+db = None
+worker = None
+scanner = None
+journal = None
+catalog = None
+engine = None
+outbox = None
+sync = None
+central_db = None
+
+
+def admin_db():
+
+    # In outbox mode the central connection is only opened once an admin
+    # screen needs it
+    global central_db
+    if central_db is None:
+        central_db = Storage(data_uri, station, shared_db) if use_outbox else db
+    return central_db
 
-con = sql.connect(data_uri, uri=True)
-cur = con.cursor()
 
 ctk.set_appearance_mode("dark")
 
-#-----Temp Data Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS temp(
-            SKU TEXT PRIMARY KEY NOT NULL, 
-            stu_ID INTEGER NOT NULL, 
-            date TEXT NOT NULL,
-            location TEXT NOT NULL
-            )""")
-cur.execute("DELETE FROM temp")
-con.commit()
-
-#-----Equipment Info Data Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS equipment(
-            name TEXT NOT NULL,
-            SKU TEXT PRIMARY KEY NOT NULL,
-            category TEXT,
-            kit TEXT,
-            kit_parts TEXT
-            )""")
-con.commit()
-
-#-----Student ID Data Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS students( 
-            stu_ID TEXT PRIMARY KEY NOT NULL, 
-            stu_name TEXT NOT NULL
-            )""")
-con.commit()
-
-#-----Master Data Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS master(
-            SKU TEXT NOT NULL, 
-            name TEXT NOT NULL,
-            stu_ID INTEGER NOT NULL,
-            stu_name TEXT, 
-            date TEXT NOT NULL,
-            location TEXT NOT NULL
-            )""")
-con.commit()
-
-#-----Availability Data Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS avail(
-            name TEXT NOT NULL,
-            location TEXT NOT NULL
-            )""")
-con.commit()
-
-#-----Student ID Import Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS import_students( 
-            stu_ID TEXT PRIMARY KEY NOT NULL, 
-            stu_name TEXT NOT NULL
-            )""")
-cur.execute("DELETE FROM import_students")
-con.commit()
-
-#-----Equipment Import Table-----#
-cur.execute("""CREATE TABLE IF NOT EXISTS import_equipment(
-            name TEXT NOT NULL,
-            SKU TEXT PRIMARY KEY NOT NULL,
-            category TEXT,
-            kit TEXT,
-            kit_parts TEXT
-            )""")
-cur.execute("DELETE FROM import_equipment")
-con.commit()
-
 
 #-----Start Window-----#
 class start_window(ctk.CTk):
@@ -91,37 +115,94 @@ class start_window(ctk.CTk):
         self.attributes("-fullscreen", True)
         self.state("normal")
         
-        #Frames
+        #Frames (built the first time show_frame asks for them)
         self.frames = {}
+        self.current_frame = None
 
         self.container = ctk.CTkFrame(self)
         self.container.pack(fill="both", expand=True)
 
+        self.status_label = ctk.CTkLabel(self, text="")
+        self.status_job = None
+
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
 
-        for F in (
-            HomeFrame, SettingsFrame, InFrame, EqFrame, StuFrame, 
-            StuImportFrame, StuModifyFrame, OutFrame, AvailFrame, 
-            MasterListFrame, AvailModifyFrame
-            ):
-            frame = F(self.container, self)
-            self.frames[F] = frame
+    def get_frame(self, frame_class):
+
+        frame = self.frames.get(frame_class)
+
+        if frame is None:
+            frame = frame_class(self.container, self)
+            self.frames[frame_class] = frame
             frame.grid(row=0, column=0, sticky="nsew")
             frame.grid_remove()
 
+        return frame
+
     def show_frame(self, frame_class):
 
-        for frame in self.frames.values():
-            frame.grid_remove()
-        frame = self.frames[frame_class]
+        if self.current_frame is not None:
+            self.current_frame.grid_remove()
+        frame = self.get_frame(frame_class)
+        self.current_frame = frame
         frame.grid()
         frame.tkraise()
         self.attributes("-fullscreen", True)
+        scanner.clear()
 
         if hasattr(frame, "on_open") and callable(frame.on_open):
             frame.on_open()
 
+    def show_progress(self, message):
+
+        if self.status_job is not None:
+            self.after_cancel(self.status_job)
+            self.status_job = None
+
+        self.status_label.configure(text=message)
+        if not self.status_label.winfo_ismapped():
+            self.status_label.pack(side="bottom", fill="x", before=self.container)
+
+    def show_status(self, message):
+
+        # A finished job's summary stays in the status bar for status_hold ms
+        self.show_progress(message)
+        self.status_job = self.after(status_hold, self.hide_progress)
+
+    def hide_progress(self):
+
+        self.status_job = None
+        self.status_label.pack_forget()
+
+    def run_job(self, message, job, *args, on_done=None, report_progress=False):
+
+        self.show_progress(f"{message}...")
+
+        def done(result):
+            self.hide_progress()
+            if on_done is not None:
+                on_done(result)
+
+        def failed(error):
+            self.hide_progress()
+            self.error(f"{message} failed: {error}")
+
+        worker.submit(job, *args, on_done=done, on_error=failed,
+            on_progress=self.show_progress if report_progress else None)
+
+    def poll_sync(self):
+
+        # Sessions the sync thread could only partly replay because another
+        # station got to an item first
+        while not sync.reports.empty():
+            session_id, SKUs = sync.reports.get_nowait()
+            catalog.sync()
+            names = ", ".join(catalog.name(SKU) or SKU for SKU in SKUs)
+            self.error(f"Not saved, already handled at another station: {names}.")
+
+        self.after(1000, self.poll_sync)
+
     def close(self):
         self.quit()
         self.destroy()
@@ -207,25 +288,17 @@ class ID_window(ctk.CTkToplevel):
 
     def ID_submit(self):
 
-        enter_ID = self.ID_entry.get()
-        cur.execute("SELECT stu_name FROM students WHERE stu_ID = ?", (enter_ID,))
-        stu_ID = cur.fetchone()
-        
-        if stu_ID:
-
-            global read_stu_ID
-            read_stu_ID = self.ID_entry.get()
-
-            if self.action == "in":
-                self.controller.show_frame(InFrame)
-            if self.action == "out":
-                self.controller.show_frame(OutFrame)
+        try:
+            session = engine.begin_session(self.ID_entry.get(), self.action)
+        except ScanError as error:
+            self.controller.error(str(error))
+            return
 
-            self.destroy()
-
-        else:
+        frame_class = InFrame if self.action == "in" else OutFrame
+        self.controller.get_frame(frame_class).session = session
+        self.controller.show_frame(frame_class)
 
-            self.controller.error("No matching student found.")
+        self.destroy()
 
     def cancel(self):
 
@@ -242,7 +315,6 @@ class InFrame(ctk.CTkFrame):
 
         self.in_tag_entry = ctk.CTkEntry(self, width=140, height=30)
         self.in_tag_entry.grid(column=0, row=0, pady=(20,0))
-        self.in_tag_entry.bind("<Return>", self.in_scan_barcode)
 
         self.in_list = ctk.CTkTextbox(self, height=300, width=300, state="disabled")
         self.in_list.grid(row=1, column=0, pady=(40,0))
@@ -252,96 +324,63 @@ class InFrame(ctk.CTkFrame):
     
     def on_open(self):
 
+        self.in_list.configure(state="normal")
+        self.in_list.delete("1.0", "end")
+        self.in_list.configure(state="disabled")
+
         self.in_tag_entry.focus_set()
+        scanner.set_target(self.in_scan_barcode)
 
     def in_tag_press(self):
         
-        cur.execute("""INSERT INTO master (SKU, name, stu_ID, stu_name, date, location) 
-        SELECT temp.SKU, equipment.name, temp.stu_ID, students.stu_name, temp.date, temp.location 
-        FROM temp
-        JOIN equipment ON temp.SKU = equipment.SKU
-        JOIN students ON temp.stu_ID = students.stu_ID""")
-        
-        cur.execute("""UPDATE avail SET location = "in" WHERE name IN
-            (SELECT name FROM equipment WHERE SKU IN (SELECT SKU FROM temp))""")
-        
-        con.commit()
+        scanner.drain()
+        rows = self.session.take()
 
-        self.controller.show_frame(HomeFrame)
-        
-    def in_update_list(self):
+        # Done with nothing scanned writes nothing, locally or centrally
+        if rows and outbox is not None:
+            outbox.add(station, rows)
+            journal.discard(rows)
+            sync.wake()
+        elif rows:
+            worker.submit(commit_rows, rows, on_done=lambda result: self.commit_done(rows, result), on_error=self.commit_failed)
 
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cur.execute("INSERT INTO temp (SKU, stu_ID, date, location) VALUES (?, ?, ?, ?)", (self.barcode, read_stu_ID, current_date, "in"))
-        con.commit()
-        
-        self.in_list.configure(state="normal")
-        cur.execute("SELECT SKU FROM temp ORDER BY date DESC LIMIT 1")
-        row = cur.fetchone()
-        bar_text = row[0] if row else None
+        self.controller.show_frame(HomeFrame)
 
-        cur.execute("SELECT name FROM equipment WHERE SKU = ?", (bar_text,))
-        row = cur.fetchone()
+    def commit_done(self, rows, result):
 
-        if row:  
-            name_text = str(row[0])
-            self.in_list.insert("end", f"{name_text}\n")
+        journal.discard(rows)
 
-        self.in_list.configure(state="disabled")
+        committed, conflicts = result
+        if conflicts:
+            catalog.sync()
+            names = ", ".join(catalog.name(row[0]) or row[0] for row in conflicts)
+            self.controller.error(f"Already checked in at another station, not saved: {names}.")
 
-    def in_scan_barcode(self, event):
+    def commit_failed(self, error):
 
-        self.barcode = self.in_tag_entry.get().strip()
-        if self.barcode:
-            
-            cur.execute("SELECT SKU FROM temp WHERE SKU = ?", (self.barcode,))
-            past_bar = cur.fetchall()
+        catalog.invalidate()
+        self.controller.error(f"Check-in could not be saved: {error}. It will be retried on restart.")
+        
+    def in_update_list(self, name_text):
 
-            if past_bar:
+        self.in_list.configure(state="normal")
+        self.in_list.insert("end", f"{name_text}\n")
+        self.in_list.configure(state="disabled")
 
-                self.controller.error("Same barcode scanned.")
+    def in_scan_barcode(self, barcode):
 
+        try:
+            result = self.session.scan(barcode)
+        except ScanError as error:
+            self.controller.error(str(error))
+        else:
+            if result.kind == "kit":
+                self.kit_in_popup = kit_window(self, self.controller, self.session, result.kit)
             else:
-                
-                cur.execute("SELECT name FROM equipment WHERE SKU = ?", (self.barcode,))
-                past_name = cur.fetchone()
-
-                if past_name:
-                    
-                    cur.execute("SELECT location from avail WHERE name = ?", (past_name))
-                    location = cur.fetchone()
-
-                    if location and location[0] == "out":
-
-                        self.kit_scan()
-                    
-                    else:
-                        self.controller.error(f"Item {past_name[0]} is not checked out.")
-                
-                else:
-                    self.controller.error("No equipment found.")
+                self.in_update_list(result.name)
 
         self.in_tag_entry.delete(0, "end")
 
-    def kit_scan(self):
-
-        cur.execute("SELECT kit FROM equipment WHERE SKU = ?", (self.barcode,))
-        kit_type = cur.fetchone()
-
-        if kit_type and kit_type[0]:
-
-            kit_type = kit_type[0].lower()
-            
-            if kit_type == "kmain":
-                self.kit_in_popup = kit_window(self, self.controller, self.barcode, "in")
-            elif kit_type == "kpart":
-                self.controller.error("Scanned item is a part of a kit.")
-            else:
-                self.controller.error(f"Unknown kit type: {kit_type}.")
-        else:
-            
-            self.in_update_list()
-
 
 #-----Equipment Check-out Frame-----#
 class OutFrame(ctk.CTkFrame):
@@ -353,7 +392,6 @@ class OutFrame(ctk.CTkFrame):
 
         self.in_tag_entry = ctk.CTkEntry(self, width=140, height=30)
         self.in_tag_entry.grid(column=0, row=0, pady=(20,0))
-        self.in_tag_entry.bind("<Return>", self.in_scan_barcode)
 
         self.in_list = ctk.CTkTextbox(self, height=300, width=300, state="disabled")
         self.in_list.grid(row=1, column=0, pady=(40,0))
@@ -363,106 +401,74 @@ class OutFrame(ctk.CTkFrame):
     
     def on_open(self):
 
+        self.in_list.configure(state="normal")
+        self.in_list.delete("1.0", "end")
+        self.in_list.configure(state="disabled")
+
         self.in_tag_entry.focus_set()
+        scanner.set_target(self.in_scan_barcode)
 
     def in_tag_press(self):
         
-        cur.execute("""INSERT INTO master (SKU, name, stu_ID, stu_name, date, location) 
-        SELECT temp.SKU, equipment.name, temp.stu_ID, students.stu_name, temp.date, temp.location 
-        FROM temp
-        JOIN equipment ON temp.SKU = equipment.SKU
-        JOIN students ON temp.stu_ID = students.stu_ID""")
-        
-        cur.execute("""UPDATE avail SET location = "out" WHERE name IN
-            (SELECT name FROM equipment WHERE SKU IN (SELECT SKU FROM temp))""")
-        
-        con.commit()
-
-        self.controller.show_frame(HomeFrame)
-        
-    def in_update_list(self):
+        scanner.drain()
+        rows = self.session.take()
 
-        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cur.execute("INSERT INTO temp (SKU, stu_ID, date, location) VALUES (?, ?, ?, ?)", (self.barcode, read_stu_ID, current_date, "out"))
-        con.commit()
+        # Done with nothing scanned writes nothing, locally or centrally
+        if rows and outbox is not None:
+            outbox.add(station, rows)
+            journal.discard(rows)
+            sync.wake()
+        elif rows:
+            worker.submit(commit_rows, rows, on_done=lambda result: self.commit_done(rows, result), on_error=self.commit_failed)
 
-        self.in_list.configure(state="normal")
-        cur.execute("SELECT SKU FROM temp ORDER BY date DESC LIMIT 1")
-        row = cur.fetchone()
-        bar_text = row[0] if row else None
+        self.controller.show_frame(HomeFrame)
 
-        cur.execute("SELECT name FROM equipment WHERE SKU = ?", (bar_text,))
-        row = cur.fetchone()
+    def commit_done(self, rows, result):
 
-        if row:  
-            name_text = str(row[0])
-            self.in_list.insert("end", f"{name_text}\n")
+        journal.discard(rows)
 
-        self.in_list.configure(state="disabled")
+        committed, conflicts = result
+        if conflicts:
+            catalog.sync()
+            names = ", ".join(catalog.name(row[0]) or row[0] for row in conflicts)
+            self.controller.error(f"Already checked out at another station, not saved: {names}.")
 
-    def in_scan_barcode(self, event):
+    def commit_failed(self, error):
 
-        self.barcode = self.in_tag_entry.get().strip()
-        if self.barcode:
-            
-            cur.execute("SELECT SKU FROM temp WHERE SKU = ?", (self.barcode,))
-            past_bar = cur.fetchall()
+        catalog.invalidate()
+        self.controller.error(f"Check-out could not be saved: {error}. It will be retried on restart.")
+        
+    def in_update_list(self, name_text):
 
-            if past_bar:
+        self.in_list.configure(state="normal")
+        self.in_list.insert("end", f"{name_text}\n")
+        self.in_list.configure(state="disabled")
 
-                self.controller.error("Same barcode scanned.")
+    def in_scan_barcode(self, barcode):
 
+        try:
+            result = self.session.scan(barcode)
+        except ScanError as error:
+            self.controller.error(str(error))
+        else:
+            if result.kind == "kit":
+                self.kit_in_popup = kit_window(self, self.controller, self.session, result.kit)
             else:
-                
-                cur.execute("SELECT name FROM equipment WHERE SKU = ?", (self.barcode,))
-                past_name = cur.fetchone()
-
-                if past_name:
-                    
-                    cur.execute("SELECT location from avail WHERE name = ?", (past_name))
-                    location = cur.fetchone()
-
-                    if location and location[0] == "in":
-
-                        self.kit_scan()
-                    
-                    else:
-                        self.controller.error(f"Item {past_name[0]} is not checked in.")
-                
-                else:
-                    self.controller.error("No equipment found.")
+                self.in_update_list(result.name)
 
         self.in_tag_entry.delete(0, "end")
 
-    def kit_scan(self):
-
-        cur.execute("SELECT kit FROM equipment WHERE SKU = ?", (self.barcode,))
-        kit_type = cur.fetchone()
-
-        if kit_type and kit_type[0]:
-
-            kit_type = kit_type[0].lower()
-            
-            if kit_type == "kmain":
-                self.kit_in_popup = kit_window(self, self.controller, self.barcode, "out")
-            elif kit_type == "kpart":
-                self.controller.error("Scanned item is a part of a kit.")
-            else:
-                self.controller.error(f"Unknown kit type: {kit_type}.")
-        else:
-            self.in_update_list()
-
 
 #-----Kit Window-----#
 class kit_window(ctk.CTkToplevel):
-    def __init__(self, parent, controller, barcode, action):
+    def __init__(self, parent, controller, session, kit_check):
         super().__init__(parent)
 
         self.controller = controller
         self.parent = parent
-        self.barcode = barcode
-        self.action = action
-        self.title("Kit Check-in" if action == "in" else "Kit Check-out")
+        self.session = session
+        self.kit_check = kit_check
+        self.title("Kit Check-in" if session.action == "in" else "Kit Check-out")
         self.geometry("400x300")
         self.grid_columnconfigure(0, weight=1)
         self.lift()
@@ -471,8 +477,8 @@ class kit_window(ctk.CTkToplevel):
 
         self.in_tag_entry = ctk.CTkEntry(self, width=140, height=30)
         self.in_tag_entry.grid(column=0, row=0, pady=(20,0))
-        self.in_tag_entry.bind("<Return>", self.kit_scan)
         self.after(100, self.in_tag_entry.focus_set)
+        scanner.push(self.kit_scan)
 
         self.text = ctk.CTkLabel(self, text="Scan in the following items:")
         self.text.grid(column=0 ,row=1, pady=(20,0), columnspan=2)
@@ -488,86 +494,53 @@ class kit_window(ctk.CTkToplevel):
 
     def print_parts(self):
 
-        cur.execute("SELECT kit_parts FROM equipment WHERE SKU = ?", (self.barcode,))
-        self.kit_parts = cur.fetchone()
-        
-        if self.kit_parts and self.kit_parts[0]: 
-
-            parts_list = self.kit_parts[0].split(",")
-
-            for part_sku in parts_list:
-                part_sku = part_sku.strip()
-                cur.execute("SELECT name FROM equipment WHERE SKU = ?", (part_sku,))
-                part_name = cur.fetchone()
-
-                if part_name and part_name[0]:
-                    self.in_list.configure(state="normal")
-                    self.in_list.insert("end", f"{part_name[0]}\n")
-                    self.in_list.configure(state="disabled")
-                else:
-                    self.controller.error(f"Unknown part SKU: {part_sku}.")
-
-        else:
-
-            self.controller.error("No kit parts found for kit.")
-            self.destroy()
+        # part_lines maps each listed part to its textbox line so a check-off
+        # redraws only that line
+        self.part_lines = {}
 
-    def kit_scan(self, event):
+        for part_sku in self.kit_check.unknown:
+            self.controller.error(f"Unknown part SKU: {part_sku}.")
 
-        self.barcode = self.in_tag_entry.get().strip()
+        self.in_list.configure(state="normal")
 
-        if self.barcode:
+        for part_sku, part_name in self.kit_check.parts:
+            self.in_list.insert("end", f"{part_name}\n")
+            self.part_lines[part_sku] = (len(self.part_lines) + 1, part_name)
 
-            if self.kit_parts and self.kit_parts[0]:
+        self.in_list.configure(state="disabled")
 
-                parts_list = self.kit_parts[0].split(",")
+    def kit_scan(self, barcode):
 
-                if self.barcode in parts_list:
-                    self.remove_part_from_list(self.barcode)
-                else:
-                    self.controller.error(f"Barcode {self.barcode} is not part of the kit.")
-            else:
-                self.controller.error("No kit parts found for the given SKU.")
+        try:
+            result = self.session.scan(barcode)
+        except ScanError as error:
+            self.controller.error(str(error))
+        else:
+            self.remove_part_from_list(barcode)
+            if result.kind == "kit_done":
+                self.parent.in_update_list(result.name)
+                self.destroy()
 
         if self.in_tag_entry.winfo_exists():
             self.in_tag_entry.delete(0, "end")
 
     def remove_part_from_list(self, barcode):
 
-        cur.execute("SELECT name FROM equipment WHERE SKU = ?", (barcode,))
-        part_name = cur.fetchone()
-
-        if part_name and part_name[0]:
-
-            part_name = part_name[0]
-
-            self.in_list.configure(state="normal")
-            lines = self.in_list.get("1.0", "end").splitlines()
-            self.in_list.delete("1.0", "end")
+        line, part_name = self.part_lines[barcode]
 
-            for line in lines:
-                if line.strip() != part_name:
-                    self.in_list.insert("end", f"{line}\n")
-
-            self.in_list.configure(state="disabled")
-
-            remaining_lines = self.in_list.get("1.0", "end").strip()
-            if not remaining_lines:
-                self.close_window()
-            
-        else:
-            self.controller.error(f"ERROR: No name found for barcode {barcode}.")
+        self.in_list.configure(state="normal")
+        self.in_list.delete(f"{line}.0", f"{line}.end")
+        self.in_list.insert(f"{line}.0", f"\u2713 {part_name}")
+        self.in_list.configure(state="disabled")
 
-    def close_window(self):
+    def destroy(self):
 
-        if self.action == "in":
-            in_frame = self.controller.frames[InFrame]
-            in_frame.in_update_list()
-        elif self.action == "out":
-            out_frame = self.controller.frames[OutFrame]
-            out_frame.in_update_list()
+        # Closing the popup before every part is scanned drops the kit
+        if self.session.kit_check is self.kit_check:
+            self.session.cancel_kit()
 
-        self.destroy()
+        scanner.pop(self.kit_scan)
+        super().destroy()
 
 
 #-----Settings Password Window-----#
@@ -618,17 +591,25 @@ class AvailFrame(ctk.CTkFrame):
         super().__init__(parent)
 
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
         self.controller = controller
+        self.search_job = None
+        self.poll_job = None
+        self.data_version = None
+        self.last_seq = 0
+
+        self.search_entry = ctk.CTkEntry(self, width=300, height=30, placeholder_text="Search name, category or SKU")
+        self.search_entry.grid(row=0, column=0, pady=(20,0))
+        self.search_entry.bind("<KeyRelease>", self.search_changed)
 
         self.frame = ctk.CTkFrame(self)
-        self.frame.grid(row=0, column=0, padx=(20,20), pady=(20,0))
+        self.frame.grid(row=1, column=0, padx=(20,20), pady=(20,0))
         self.frame.grid_columnconfigure(0, weight=1)
         self.frame.grid_rowconfigure(0, weight=1)
 
         self.cancel_button = ctk.CTkButton(
             self, text="Back", command=lambda: controller.show_frame(HomeFrame), width=200, height=30)
-        self.cancel_button.grid(row=1, pady=(20,20))
+        self.cancel_button.grid(row=2, pady=(20,20))
 
     def on_open(self):
 
@@ -636,27 +617,70 @@ class AvailFrame(ctk.CTkFrame):
 
     def create_table(self):
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
+        if not hasattr(self, "table"):
+            from tables import SheetTable
 
-        cur.execute("SELECT name, location FROM avail ORDER BY name ASC")
-        list = cur.fetchall()
+            self.table = SheetTable(self.frame, ["Name", "SKU", "Location"], key_column=1)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=1, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
 
-        name = [item[0] for item in list]
-        location = [item[1] for item in list]
+        self.search()
 
-        data = [[name, location] for name, location in zip(name, location)]
+        if self.poll_job is None:
+            self.poll_job = self.after(avail_poll_interval, self.poll_changes)
 
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["Name", "Location"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.disable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
-        self.frame.grid(row=0, column=0, sticky="nswe")
-        self.sheet.grid(row=0, column=0, sticky="nswe")
+    def search_changed(self, event):
+
+        # Wait for a short pause in typing so a burst of keys runs one query
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(search_delay, self.search)
+
+    def search(self):
+
+        self.search_job = None
+        text = self.search_entry.get().strip()
+
+        # Read the change position first, so a commit landing during the
+        # query is applied again on the next poll rather than missed
+        self.data_version = db.fetchone("data_version")[0]
+        self.last_seq = db.fetchone("avail_last_change")[0]
+
+        if text:
+            self.table.refresh(search_avail(db, text))
+        else:
+            self.table.refresh(db.fetchall("avail_list"))
+
+    def poll_changes(self):
+
+        # Runs while the screen is shown. data_version only moves when another
+        # connection (the DB worker, another station) has committed, so an
+        # idle dashboard costs one pragma per poll.
+        if not self.winfo_ismapped():
+            self.poll_job = None
+            return
+
+        self.poll_job = self.after(avail_poll_interval, self.poll_changes)
+
+        data_version = db.fetchone("data_version")[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+
+        if db.fetchone("avail_first_change")[0] > self.last_seq + 1:
+            self.search()
+            return
+
+        changes = db.fetchall("avail_changed", (self.last_seq,))
+        if not changes:
+            return
+        self.last_seq = max(change[3] for change in changes)
+
+        if self.search_entry.get().strip() or any(change[0] is None for change in changes):
+            self.search()
+        elif self.table.patch_rows([change[:3] for change in changes], [2]):
+            self.table.refresh(db.fetchall("avail_list"))
 
 
 #-----Settings Frame-----#
@@ -679,17 +703,21 @@ class SettingsFrame(ctk.CTkFrame):
             self, text="Master List", command=lambda: controller.show_frame(MasterListFrame), width=200, height=30)
         self.master_list_button.grid(row=2, column=0, pady=(40,0))
 
+        self.history_button = ctk.CTkButton(
+            self, text="Checkout History", command=lambda: controller.show_frame(HistoryFrame), width=200, height=30)
+        self.history_button.grid(row=3, column=0, pady=(40,0))
+
         self.avail_modify_button = ctk.CTkButton(
             self, text="Modify Availability", command=lambda: controller.show_frame(AvailModifyFrame), width=200, height=30)
-        self.avail_modify_button.grid(row=3, column=0, pady=(40,0))
+        self.avail_modify_button.grid(row=4, column=0, pady=(40,0))
 
         self.back_button = ctk.CTkButton(
             self, text="Back", command=lambda: controller.show_frame(HomeFrame), width=200, height=30)
-        self.back_button.grid(row=4, column=0, pady=(40,0))
+        self.back_button.grid(row=5, column=0, pady=(40,0))
 
         self.quit_button = ctk.CTkButton(
             self, text="Quit", command=self.controller.close, width=200, height=30)
-        self.quit_button.grid(row=5, column=0, pady=(40,0))
+        self.quit_button.grid(row=6, column=0, pady=(40,0))
         
 
 #-----Equipment Frame-----#
@@ -714,91 +742,55 @@ class EqFrame(ctk.CTkFrame):
         self.save_button.grid(row=1, pady=(20,20), padx=(0,70), sticky="e")
 
     def on_open(self):
-        
+
+        # Save waits for the import: until then the sheet is missing or
+        # still shows the previous preview
+        self.save_button.configure(state="disabled")
         self.import_csv()
-        self.create_table()
     
     def import_csv(self):
         
-        cur.execute("DELETE FROM import_equipment")
-        con.commit()
-        for eq_csv in eq_csv_path.glob("*.csv"):
-            with open(eq_csv, mode='r', newline='', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                
-                for _ in range(19):
-                    next(reader, None)
-                
-                for row in reader:
-                    csv_name = row[0].strip()
-                    csv_category = row[4].strip()
-                    csv_kit = row[5].strip()
-                    csv_SKU = row[6].strip()
-                    csv_kit_parts = ",".join([part.strip() for part in row[12:] if part.strip()])
-
-                    if not (csv_name or csv_SKU or csv_category or csv_kit or csv_kit_parts):
-                        continue
-
-                    cur.execute("""
-                        INSERT OR IGNORE INTO import_equipment 
-                        (name, SKU, category, kit, kit_parts) 
-                        VALUES (?, ?, ?, ?, ?)""", 
-                        (csv_name, csv_SKU, csv_category, csv_kit, csv_kit_parts))
-                con.commit()
+        from importers import import_equipment_csv
+
+        self.controller.run_job("Importing equipment", import_equipment_csv, sorted(eq_csv_path.glob("*.csv")),
+            on_done=self.imported, report_progress=True)
+
+    def imported(self, result):
+
+        from importers import format_timings
+
+        count, timings = result
+        self.controller.show_status(format_timings("Equipment import", count, timings))
+        self.create_table()
+        self.save_button.configure(state="normal")
 
     def create_table(self):
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
-
-        cur.execute("SELECT name, SKU, category, kit, kit_parts FROM import_equipment ORDER BY SKU ASC")
-        list = cur.fetchall()
-
-        name = [equipment[0] for equipment in list]
-        SKU = [equipment[1] for equipment in list]
-        category = [equipment[2] for equipment in list]
-        kit = [equipment[3] for equipment in list]
-        kit_parts = [equipment[4] for equipment in list]
-
-        data = [[name, SKU, category, kit, kit_parts]
-            for name, SKU, category, kit, kit_parts in 
-            zip(name, SKU, category, kit, kit_parts)]
-
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["Name", "SKU", "Category", "Kit", "Kit Parts"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.enable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
-        self.frame.grid(row=0, column=0, sticky="nswe")
-        self.sheet.grid(row=0, column=0, sticky="nswe")
+        if not hasattr(self, "table"):
+            from tables import SheetTable
 
-    def save(self):
+            self.table = SheetTable(self.frame, ["Name", "SKU", "Category", "Kit", "Kit Parts"], key_column=1, editable=True)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=0, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
 
-        cur.execute("DELETE FROM equipment")
-        cur.execute("DELETE FROM avail")
-        con.commit()
-        
-        new_data = self.sheet["A1"].expand().data
+        self.table.refresh(admin_db().fetchall("import_equipment_list", (station,)))
 
-        new_name = [equipment[0] for equipment in new_data]
-        new_SKU = [equipment[1] for equipment in new_data]
-        new_category = [equipment[2] for equipment in new_data]
-        new_kit = [equipment[3] for equipment in new_data]
-        new_kit_parts = [equipment[4] for equipment in new_data]
+    def save(self):
 
-        for name, SKU, category, kit, kit_parts in zip(new_name, new_SKU, new_category, new_kit, new_kit_parts):
+        new_data = self.sheet["A1"].expand().data
 
-            cur.execute("""INSERT INTO equipment (name, SKU, category, kit, kit_parts) 
-                VALUES (?, ?, ?, ?, ?)""", (name, SKU, category, kit, kit_parts))
-            cur.execute("DELETE FROM import_equipment")
+        new_items = {}
+        for equipment in new_data:
+            name, SKU, category, kit, kit_parts = [clean_cell(value) for value in equipment[:5]]
+            if SKU:
+                new_items[SKU] = (name, category, kit, kit_parts)
 
-            cur.execute("INSERT INTO avail (name, location) VALUES (?, ?)", (name, "in"))
+        self.controller.run_job("Saving equipment", save_equipment, new_items, on_done=self.saved)
 
-        con.commit()
+    def saved(self, result):
 
+        catalog.invalidate()
         self.controller.show_frame(SettingsFrame)
 
 
@@ -849,69 +841,56 @@ class StuImportFrame(ctk.CTkFrame):
         self.del_prev_stu.grid(row=1)
 
     def on_open(self):
-        
+
+        # Save waits for the import: until then the sheet is missing or
+        # still shows the previous preview
+        self.save_button.configure(state="disabled")
         self.import_csv()
-        self.create_table()
     
     def import_csv(self):
         
-        cur.execute("DELETE FROM import_students")
-        con.commit()
-        for stu_csv in stu_csv_path.glob("*.csv"):
-            with open(stu_csv, mode='r', newline='', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                
-                for _ in range(7):
-                    next(reader, None)
-                
-                for row in reader:
-                    if row and row[0] and row[1]:
-                        csv_name = row[0].strip()
-                        csv_id = row[1].strip()
-                
-                        cur.execute("INSERT OR IGNORE INTO import_students (stu_ID, stu_name) VALUES (?, ?)", (csv_id, csv_name))
-                con.commit()
+        from importers import import_roster_csvs
 
-    def create_table(self):
+        self.controller.run_job("Importing students", import_roster_csvs, sorted(stu_csv_path.glob("*.csv")),
+            on_done=self.imported, report_progress=True)
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
+    def imported(self, result):
 
-        cur.execute("SELECT stu_name, stu_ID FROM import_students ORDER BY stu_name ASC")
-        list = cur.fetchall()
+        from importers import format_timings
 
-        name = [student[0] for student in list]
-        ID = [student[1] for student in list]
+        count, timings = result
+        self.controller.show_status(format_timings("Student import", count, timings))
+        self.create_table()
+        self.save_button.configure(state="normal")
 
-        data = [[name, ID] for name, ID in zip(name, ID)]
+    def create_table(self):
 
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["Student Name", "ID"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.enable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
-        self.frame.grid(row=0, column=0, sticky="nswe")
-        self.sheet.grid(row=0, column=0, sticky="nswe")
+        if not hasattr(self, "table"):
+            from tables import SheetTable
+
+            self.table = SheetTable(self.frame, ["Student Name", "ID"], key_column=1, editable=True)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=0, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
+
+        self.table.refresh(admin_db().fetchall("import_students_list", (station,)))
 
     def save(self):
 
-        if self.check_state.get() == "on":
-            cur.execute("DELETE FROM students")
-            con.commit()
-        
         new_data = self.sheet["A1"].expand().data
 
-        new_name = [student[0] for student in new_data]
-        new_ID = [student[1] for student in new_data]
+        new_students = {}
+        for student in new_data:
+            stu_name, stu_ID = [clean_cell(value) for value in student[:2]]
+            if stu_ID:
+                new_students[stu_ID] = stu_name
 
-        for stu_id, stu_name in zip(new_ID, new_name):
-            cur.execute("INSERT INTO students (stu_ID, stu_name) VALUES (?, ?)", (stu_id, stu_name))
-            cur.execute("DELETE FROM import_students")
-        con.commit()
+        self.controller.run_job("Saving students", save_imported_students, new_students,
+            self.check_state.get() == "on", on_done=self.saved)
 
+    def saved(self, result):
+
+        catalog.invalidate()
         self.controller.show_frame(SettingsFrame)
 
 
@@ -940,14 +919,17 @@ class StuModifyFrame(ctk.CTkFrame):
 
         new_data = self.sheet["A1"].expand().data
 
-        new_name = [student[0] for student in new_data]
-        new_ID = [student[1] for student in new_data]
+        new_students = {}
+        for student in new_data:
+            stu_name, stu_ID = [clean_cell(value) for value in student[:2]]
+            if stu_ID:
+                new_students[stu_ID] = stu_name
+
+        self.controller.run_job("Saving students", save_students, new_students, on_done=self.saved)
 
-        cur.execute("DELETE FROM students")
-        for stu_id, stu_name in zip(new_ID, new_name):
-            cur.execute("INSERT INTO students (stu_ID, stu_name) VALUES (?, ?)", (stu_id, stu_name))
-        con.commit()
+    def saved(self, result):
 
+        catalog.invalidate()
         self.controller.show_frame(SettingsFrame)
 
     def on_open(self):
@@ -956,27 +938,15 @@ class StuModifyFrame(ctk.CTkFrame):
 
     def create_table(self):
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
+        if not hasattr(self, "table"):
+            from tables import SheetTable
 
-        cur.execute("SELECT stu_name, stu_ID FROM students ORDER BY stu_name ASC")
-        list = cur.fetchall()
+            self.table = SheetTable(self.frame, ["Student Name", "ID"], key_column=1, editable=True)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=0, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
 
-        name = [student[0] for student in list]
-        ID = [student[1] for student in list]
-
-        data = [[name, ID] for name, ID in zip(name, ID)]
-
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["Student Name", "ID"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.enable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
-        self.frame.grid(row=0, column=0, sticky="nswe")
-        self.sheet.grid(row=0, column=0, sticky="nswe")
+        self.table.refresh(admin_db().fetchall("students_list"))
 
 
 #-----Master List Frame-----#
@@ -1001,36 +971,185 @@ class MasterListFrame(ctk.CTkFrame):
 
         self.create_table()
 
+    def fetch_page(self):
+
+        # Keyset pagination: continue below the last (date, seq) shown so
+        # each page is a range read on ledger_date, however long the ledger gets
+        if self.last_key is None:
+            rows = admin_db().fetchall("ledger_first_page", (master_page_size,))
+        else:
+            rows = admin_db().fetchall("ledger_next_page", (*self.last_key, master_page_size))
+
+        if len(rows) < master_page_size:
+            self.exhausted = True
+        if rows:
+            self.last_key = (rows[-1][5], rows[-1][0])
+
+        # keys holds the (date, seq) of every row shown, oldest first
+        self.keys[:0] = [(row[5], row[0]) for row in reversed(rows)]
+        return [list(row[1:]) for row in rows]
+
     def create_table(self):
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
-
-        cur.execute("SELECT SKU, name, stu_ID, stu_name, date, location FROM master ORDER BY date DESC")
-        list = cur.fetchall()
-
-        SKU = [item[0] for item in list]
-        name = [item[1] for item in list]
-        stu_ID = [item[2] for item in list]
-        stu_name = [item[3] for item in list]
-        date = [item[4] for item in list]
-        location = [item[5] for item in list]
-
-        data = [[SKU, name, stu_ID, stu_name, date, location]
-            for SKU, name, stu_ID, stu_name, date, location
-            in zip(SKU, name, stu_ID, stu_name, date, location)]
-
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["SKU", "Equipment Name", "Student ID", "Student Name", "Date", "Location"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.disable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
+        if hasattr(self, "table"):
+            self.load_newer()
+            return
+
+        from tables import SheetTable
+
+        self.table = SheetTable(self.frame, 
+            ["SKU", "Equipment Name", "Student ID", "Student Name", "Date", "Location", "Event"], key_column=0)
+        self.sheet = self.table.sheet
+
+        self.last_key = None
+        self.keys = []
+        self.exhausted = False
+        self.page_pending = False
+        self.max_seq = admin_db().fetchone("ledger_max_seq")[0]
+
+        self.table.refresh(self.fetch_page())
+        self.sheet.bind("<<SheetRedrawn>>", self.check_scroll)
         self.frame.grid(row=0, column=0, sticky="nswe")
         self.sheet.grid(row=0, column=0, sticky="nswe")
 
+    def load_newer(self):
+
+        # The ledger is append-only, so anything committed since the last
+        # view has a higher seq; reading by seq is a seek on the primary key.
+        # Its date is usually the newest and it goes on top, but a session
+        # scanned earlier and committed late is slotted in by date, or left
+        # for a later page if it falls below the rows loaded so far.
+        rows = admin_db().fetchall("ledger_newer", (self.max_seq,))
+        if not rows:
+            return
+
+        self.max_seq = rows[-1][0]
+        on_top = []
+        for row in sorted(rows, key=lambda row: (row[5], row[0])):
+            key = (row[5], row[0])
+            if not self.keys or key > self.keys[-1]:
+                on_top.insert(0, row[1:])
+                self.keys.append(key)
+            elif self.exhausted or key > self.last_key:
+                position = bisect.bisect_left(self.keys, key)
+                if position < len(self.keys) and self.keys[position] == key:
+                    continue
+                self.keys.insert(position, key)
+                self.table.insert_rows([row[1:]], idx=len(self.keys) - 1 - position)
+
+        self.table.insert_rows(on_top, idx=0)
+
+    def check_scroll(self, event):
+
+        if self.exhausted or self.page_pending:
+            return
+
+        if self.sheet.get_yview()[1] >= 0.9:
+            self.page_pending = True
+            self.after_idle(self.load_page)
+
+    def load_page(self):
+
+        self.table.insert_rows(self.fetch_page())
+
+        self.page_pending = False
+
+
+#-----Checkout History Frame-----#
+# "Who had this item": a SKU and a time gives the holder at that moment, a
+# SKU or student ID with a date (or a From/To range) lists every checkout
+# overlapping that day or range.
+class HistoryFrame(ctk.CTkFrame):
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        self.controller = controller
+
+        self.query_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.query_frame.grid(row=0, column=0, pady=(20,0))
+
+        self.key_entry = ctk.CTkEntry(self.query_frame, width=200, height=30, placeholder_text="SKU or Student ID")
+        self.key_entry.grid(row=0, column=0, padx=(0,10))
+        self.start_entry = ctk.CTkEntry(self.query_frame, width=170, height=30, placeholder_text="At / From (YYYY-MM-DD HH:MM)")
+        self.start_entry.grid(row=0, column=1, padx=(0,10))
+        self.end_entry = ctk.CTkEntry(self.query_frame, width=170, height=30, placeholder_text="To (optional)")
+        self.end_entry.grid(row=0, column=2, padx=(0,10))
+        self.search_button = ctk.CTkButton(self.query_frame, text="Search", command=self.search, width=100, height=30)
+        self.search_button.grid(row=0, column=3)
+
+        for entry in (self.key_entry, self.start_entry, self.end_entry):
+            entry.bind("<Return>", lambda event: self.search())
+
+        self.frame = ctk.CTkFrame(self)
+        self.frame.grid(row=1, column=0, padx=(20,20), pady=(20,0))
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.frame.grid_rowconfigure(0, weight=1)
+
+        self.cancel_button = ctk.CTkButton(
+            self, text="Back", command=lambda: controller.show_frame(SettingsFrame), width=200, height=30)
+        self.cancel_button.grid(row=2, pady=(20,20))
+
+    def on_open(self):
+
+        self.create_table()
+        self.key_entry.focus()
+
+    def create_table(self):
+
+        if not hasattr(self, "table"):
+            from tables import SheetTable
+
+            self.table = SheetTable(self.frame,
+                ["SKU", "Equipment Name", "Student ID", "Student Name", "Out", "In"], key_column=0)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=1, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
+
+    def read_date(self, entry):
+
+        # Returns (datetime, whether only a date was typed)
+        text = entry.get().strip()
+        if not text:
+            return None, False
+        return datetime.fromisoformat(text), len(text) <= 10
+
+    def search(self):
+
+        key = self.key_entry.get().strip()
+        try:
+            start, whole_day = self.read_date(self.start_entry)
+            end, end_day = self.read_date(self.end_entry)
+        except ValueError:
+            self.controller.error("Dates must look like 2024-03-15 or 2024-03-15 14:30.")
+            return
+
+        if not key or start is None:
+            self.controller.error("Enter a SKU or student ID and a date.")
+            return
+
+        if end is not None and end_day:
+            end += timedelta(days=1)
+        point = end is None and not whole_day
+        if end is None:
+            end = start + timedelta(days=1) if whole_day else start + timedelta(seconds=1)
+
+        if catalog.item(key) is None and catalog.student_name(key):
+            rows = held_by(admin_db(), key, start, end)
+        elif point:
+            row = holder_at(admin_db(), key, start)
+            rows = [row] if row else []
+        else:
+            rows = holders_between(admin_db(), key, start, end)
+
+        if not rows:
+            self.controller.error(f"Nothing checked out for {key} at {history_date(start)}." if point
+                else f"Nothing checked out for {key} between {history_date(start)} and {history_date(end)}.")
+
+        self.table.refresh([[SKU, name or "", stu_ID or "", stu_name or "", out_date, in_date or "still out"]
+            for SKU, name, stu_ID, stu_name, out_date, in_date in rows])
+
 
 #-----Availibility Modify Frame-----#
 class AvailModifyFrame(ctk.CTkFrame):
@@ -1049,56 +1168,144 @@ class AvailModifyFrame(ctk.CTkFrame):
         self.cancel_button = ctk.CTkButton(
             self, text="Cancel", command=lambda: controller.show_frame(SettingsFrame), width=200, height=30)
         self.cancel_button.grid(row=1, pady=(20,20), padx=(70,0), sticky="w")
+        self.rebuild_button = ctk.CTkButton(
+            self, text="Rebuild from Ledger", command=self.rebuild, width=200, height=30)
+        self.rebuild_button.grid(row=1, pady=(20,20))
         self.save_button = ctk.CTkButton(
             self, text="Save Changes", command=self.save, width=200, height=30)
         self.save_button.grid(row=1, pady=(20,20), padx=(0,70), sticky="e")
+        self.drift_label = ctk.CTkLabel(self, text="", wraplength=600, justify="center")
+        self.drift_label.grid(row=2, pady=(0,20))
 
     def on_open(self):
 
+        self.drift_label.configure(text="")
         self.create_table()
-    
+
+    def rebuild(self):
+
+        self.controller.run_job("Rebuilding availability", rebuild_avail, on_done=self.rebuilt)
+
+    def rebuilt(self, drift):
+
+        catalog.invalidate()
+        SKUs = sorted({row[1] for row in drift})
+        if SKUs:
+            shown = ", ".join(SKUs[:10]) + (", ..." if len(SKUs) > 10 else "")
+            self.drift_label.configure(text=f"Rebuilt from the ledger, {len(SKUs)} items differed: {shown}")
+        else:
+            self.drift_label.configure(text="Rebuilt from the ledger, no items differed")
+        self.create_table()
+
     def save(self):
 
         new_data = self.sheet["A1"].expand().data
 
         new_name = [item[0] for item in new_data]
-        new_location = [item[1] for item in new_data]
+        new_SKU = [item[1] for item in new_data]
+        new_location = [item[2] for item in new_data]
 
-        cur.execute("DELETE FROM avail")
-        for name, location in zip(new_name, new_location):
-            cur.execute("INSERT INTO avail (name, location) VALUES (?, ?)", (name, location))
-        con.commit()
+        self.controller.run_job("Saving availability", save_avail, list(zip(new_SKU, new_name, new_location)),
+            dict(self.loaded), on_done=self.saved)
 
-        self.controller.show_frame(SettingsFrame)
+    def saved(self, result):
 
-    def create_table(self):
+        catalog.invalidate()
+        conflicts = result[3]
+        if not conflicts:
+            self.controller.show_frame(SettingsFrame)
+            return
 
-        if hasattr(self, "sheet") and self.sheet.winfo_exists():
-            self.sheet.destroy()
+        # Rows another station changed while the sheet was open were kept
+        # as they are; reload so the admin sees and can redo them
+        shown = ", ".join(conflicts[:10]) + (", ..." if len(conflicts) > 10 else "")
+        self.drift_label.configure(
+            text=f"{len(conflicts)} items changed at another station and were not saved: {shown}")
+        self.create_table()
 
-        cur.execute("SELECT name, location FROM avail ORDER BY name ASC")
-        list = cur.fetchall()
+    def create_table(self):
 
-        name = [item[0] for item in list]
-        location = [item[1] for item in list]
+        if not hasattr(self, "table"):
+            from tables import SheetTable
 
-        data = [[name, location] for name, location in zip(name, location)]
+            self.table = SheetTable(self.frame, ["Name", "SKU", "Location"], key_column=1, editable=True)
+            self.sheet = self.table.sheet
+            self.frame.grid(row=0, column=0, sticky="nswe")
+            self.sheet.grid(row=0, column=0, sticky="nswe")
 
-        self.sheet = Sheet(self.frame,
-                           data=data,
-                           headers=["Name", "Location"],
-                           width=760,
-                           height=410,
-                           theme="dark blue")
-        self.sheet.enable_bindings()
-        self.sheet.set_all_cell_sizes_to_text()
-        self.frame.grid(row=0, column=0, sticky="nswe")
-        self.sheet.grid(row=0, column=0, sticky="nswe")
+        # The save is checked against these rows, not against avail as it is then
+        rows = admin_db().fetchall("avail_list_versions")
+        self.loaded = {SKU: (name, location, version) for name, SKU, location, version in rows}
+        self.table.refresh([row[:3] for row in rows])
 
 
 #-----Start Program-----#
 if __name__ == "__main__":
+    if use_outbox:
+        db = Storage(replica_path.resolve().as_uri(), station)
+    else:
+        db = Storage(data_uri, station, shared_db)
+    worker = DBWorker(data_uri, station, shared_db)
+    scanner = ScanCapture()
+    journal = ScanJournal(journal_path)
+    catalog = Catalog(db)
+    engine = Engine(db, journal, catalog)
+    mark_startup("connect")
+
+    upgraded = db.create_tables()
+    mark_startup("schema upgrade" if upgraded else "schema check")
+
+    if use_outbox:
+        from outbox import Outbox, SyncWorker
+
+        # An unfinished session goes to the outbox like any other; the sync
+        # worker brings data.db's schema up to date once it can reach it
+        outbox = Outbox(outbox_path)
+        recovered = journal.read()
+        if recovered:
+            outbox.add(station, recovered)
+            journal.clear()
+    else:
+        recovered = recover_journal(db, journal)
+    if recovered:
+        print(f"Recovered {len(recovered)} scans from an unfinished session.")
+    mark_startup("journal recovery")
+
+    if use_outbox:
+        sync = SyncWorker(data_uri, outbox_path, station, replica_path=replica_path, shared=shared_db)
+        sync.start()
+    mark_startup("outbox")
+
     start_app = start_window()
+    worker.start(start_app)
+    scanner.start(start_app)
+    if sync is not None:
+        start_app.poll_sync()
+    mark_startup("main window")
+
     start_app.show_frame(HomeFrame)
+    mark_startup("home screen")
+
+    def first_idle():
+        mark_startup("first idle")
+        catalog.ensure_loaded()
+        mark_startup("catalog cache")
+        if profile_startup:
+            print_startup_timeline()
+
+    start_app.after_idle(first_idle)
     start_app.mainloop()
-    con.close()
\ No newline at end of file
+
+    worker.stop()
+    if sync is not None:
+        sync.stop()
+        if profile_startup:
+            print(f"Outbox: {outbox.counts()}")
+        outbox.close()
+    if profile_startup:
+        print(db.report())
+        if worker.db is not None:
+            print(worker.db.report())
+    db.close()
+    if central_db is not None and central_db is not db:
+        central_db.close()
\ No newline at end of file
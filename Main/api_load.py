@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import random
+import sqlite3 as sql
+import time
+from pathlib import Path
+
+from api_server import default_port
+from storage import queries
+
+#-----API Load Generator-----#
+# Opens a number of keep-alive connections to a running api_server and has
+# each one loop through whole checkouts: start a session, scan a few items,
+# commit. Prints request throughput, latency percentiles and how many rows
+# came back as conflicts. The server does not list students, so their IDs
+# are read from the same data.db, opened read-only.
+#
+#     python Main/api_server.py --db /tmp/copy.db &
+#     python Main/api_load.py --db /tmp/copy.db --clients 20 --seconds 10
+
+
+class Client:
+    def __init__(self, host, port):
+
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+                          + payload)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_client(client, students, SKUs, deadline, batch, stats):
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status, reply = await client.request("POST", "/sessions",
+            {"student_id": random.choice(students), "action": random.choice(("in", "out"))})
+        stats["latencies"].append(time.perf_counter() - started)
+        if status != 200:
+            stats["errors"] += 1
+            continue
+        token = reply["session"]
+
+        for SKU in random.sample(SKUs, min(batch, len(SKUs))):
+            started = time.perf_counter()
+            status, reply = await client.request("POST", f"/sessions/{token}/scan", {"sku": SKU})
+            stats["latencies"].append(time.perf_counter() - started)
+            stats["rejected" if status == 409 else "scanned"] += 1
+
+        started = time.perf_counter()
+        status, reply = await client.request("POST", f"/sessions/{token}/commit")
+        stats["latencies"].append(time.perf_counter() - started)
+        if status == 200:
+            stats["committed"] += len(reply["committed"])
+            stats["conflicts"] += len(reply["conflicts"])
+            stats["sessions"] += 1
+        else:
+            stats["errors"] += 1
+
+    client.close()
+
+
+async def run(options):
+
+    con = sql.connect(Path(options.db).resolve().as_uri() + "?mode=ro", uri=True)
+    students = [stu_ID for stu_ID, stu_name in con.execute(queries["students_all"])]
+    con.close()
+
+    setup = Client(options.host, options.port)
+    status, avail = await setup.request("GET", "/avail")
+    setup.close()
+
+    SKUs = [row["sku"] for row in avail][:options.items]
+    if not students or not SKUs:
+        raise SystemExit("The server has no students or no equipment to check out.")
+
+    stats = {"latencies": [], "sessions": 0, "scanned": 0, "rejected": 0, "committed": 0, "conflicts": 0, "errors": 0}
+    started = time.perf_counter()
+    deadline = started + options.seconds
+    await asyncio.gather(*(run_client(Client(options.host, options.port), students, SKUs, deadline, options.batch, stats)
+        for _ in range(options.clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(stats.pop("latencies"))
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{len(latencies) / elapsed:.0f} requests/s over {elapsed:.1f} s with {options.clients} clients")
+    print(f"latency p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms")
+    print(", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generate checkout load against api_server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--db", default=str(Path(__file__).parent / "DB" / "data.db"),
+        help="the server's data.db, to draw student IDs from")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--items", type=int, default=200, help="how many SKUs to draw from")
+    parser.add_argument("--batch", type=int, default=3, help="items scanned per session")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import json
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from catalog import search_avail
+from engine import Engine, ScanError
+from session import ScanJournal, commit_groups, recover_journal
+from storage import Storage
+
+default_port = 8765
+max_group = 64
+max_body = 64 * 1024
+session_timeout = 600
+session_sweep = 30
+
+#-----Checkout API Server-----#
+# A small HTTP/JSON front end to the checkout engine, so tablets or a second
+# desk talk to one process instead of each opening data.db. Requests are
+# handled on the asyncio loop against the in-memory catalog; commits are
+# queued and a single writer thread takes everything queued at once and
+# commits it as one transaction, so concurrent checkouts share an fsync.
+# The same thread appends accepted scans to the journal and takes each
+# batch's scans out of it again, and sessions left idle for session_timeout
+# seconds (a tablet that dropped off) are abandoned there too, so their
+# scans are never recovered as checkouts. A student ID is all it takes to
+# open a session, so there is deliberately no route that lists them.
+#
+#   GET    /students/<id>                {"id", "name"}
+#   GET    /avail?q=<text>               [{"name", "sku", "location"}]
+#   POST   /sessions                     {"student_id", "action"} -> {"session"}
+#   POST   /sessions/<token>/scan        {"sku"} -> {"kind", "sku", "name", "outstanding"}
+#   POST   /sessions/<token>/commit      {"committed", "conflicts"}
+#   DELETE /sessions/<token>             {}
+#
+# Rejected scans answer 409 with {"error": message}, the same text the
+# kiosk shows.
+
+status_text = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    def __init__(self, data_uri, station, journal_path, shared=False):
+
+        self.data_uri = data_uri
+        self.station = station
+        self.shared = shared
+        self.db = Storage(data_uri, station, shared)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-writer",
+            initializer=self.open_writer)
+        self.writer_db = None
+        self.engine = Engine(self.db, ScanJournal(journal_path, self.writer))
+        self.sessions = {}
+        self.last_seen = {}
+        self.commits = None
+        self.group_sizes = []
+
+        self.routes = [
+            ("GET", re.compile(r"/students/([^/]+)"), self.get_student),
+            ("GET", re.compile(r"/avail"), self.get_avail),
+            ("POST", re.compile(r"/sessions"), self.begin_session),
+            ("POST", re.compile(r"/sessions/([^/]+)/scan"), self.scan),
+            ("POST", re.compile(r"/sessions/([^/]+)/commit"), self.commit),
+            ("DELETE", re.compile(r"/sessions/([^/]+)"), self.end_session),
+        ]
+
+    def open_writer(self):
+
+        self.writer_db = Storage(self.data_uri, self.station, self.shared)
+
+    #-----Endpoints-----#
+    async def get_student(self, query, body, stu_ID):
+
+        stu_name = self.engine.catalog.student_name(stu_ID)
+        if not stu_name:
+            raise ApiError(404, "No matching student found.")
+        return {"id": stu_ID, "name": stu_name}
+
+    async def get_avail(self, query, body):
+
+        text = query.get("q", [""])[0].strip()
+        rows = search_avail(self.db, text) if text else self.db.fetchall("avail_list")
+        return [{"name": name, "sku": SKU, "location": location} for name, SKU, location in rows]
+
+    async def begin_session(self, query, body):
+
+        try:
+            session = self.engine.begin_session(body.get("student_id", ""), body.get("action"))
+        except ValueError as error:
+            raise ApiError(400, str(error))
+
+        token = secrets.token_urlsafe(12)
+        self.sessions[token] = session
+        self.last_seen[token] = time.monotonic()
+        return {"session": token}
+
+    def session(self, token):
+
+        session = self.sessions.get(token)
+        if session is None:
+            raise ApiError(404, "No such session.")
+        self.last_seen[token] = time.monotonic()
+        return session
+
+    def pop_session(self, token):
+
+        self.last_seen.pop(token, None)
+        return self.sessions.pop(token, None)
+
+    async def scan(self, query, body, token):
+
+        result = self.session(token).scan(body.get("sku", ""))
+        reply = {"kind": result.kind, "sku": result.SKU, "name": result.name}
+        if result.kit is not None:
+            reply["outstanding"] = sorted(result.kit.outstanding)
+        return reply
+
+    async def commit(self, query, body, token):
+
+        session = self.pop_session(token)
+        if session is None:
+            raise ApiError(404, "No such session.")
+
+        rows = session.take()
+        future = asyncio.get_running_loop().create_future()
+        await self.commits.put((rows, future))
+        committed, conflicts = await future
+
+        if conflicts:
+            self.engine.catalog.sync()
+        return {"committed": [row[0] for row in committed], "conflicts": [row[0] for row in conflicts]}
+
+    async def end_session(self, query, body, token):
+
+        session = self.pop_session(token)
+        if session is not None:
+            await self.discard_rows(session.abandon())
+        return {}
+
+    async def discard_rows(self, rows):
+
+        if rows:
+            await asyncio.get_running_loop().run_in_executor(self.writer, self.engine.journal.discard, rows)
+
+    async def expire_sessions(self):
+
+        while True:
+            await asyncio.sleep(session_sweep)
+            cutoff = time.monotonic() - session_timeout
+            rows = []
+            for token in [token for token, seen in self.last_seen.items() if seen < cutoff]:
+                rows += self.pop_session(token).abandon()
+            await self.discard_rows(rows)
+
+    #-----Group Commit-----#
+    def write_group(self, groups):
+
+        # Runs on the writer thread, which owns writer_db, so a failed batch
+        # is rolled back here before the committer fails its futures. The
+        # scans leave the journal either way: the clients are told the
+        # outcome, so a restart must not commit them again.
+        try:
+            return commit_groups(self.writer_db, groups)
+        except BaseException:
+            if self.writer_db.con.in_transaction:
+                self.writer_db.con.rollback()
+            raise
+        finally:
+            self.engine.journal.discard([row for rows in groups for row in rows])
+
+    async def committer(self):
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            pending = [await self.commits.get()]
+            while len(pending) < max_group and not self.commits.empty():
+                pending.append(self.commits.get_nowait())
+
+            self.group_sizes.append(len(pending))
+            try:
+                results = await loop.run_in_executor(self.writer, self.write_group, [rows for rows, future in pending])
+            except Exception as error:
+                self.engine.catalog.invalidate()
+                for rows, future in pending:
+                    future.set_exception(error)
+            else:
+                for (rows, future), result in zip(pending, results):
+                    future.set_result(result)
+
+    #-----HTTP-----#
+    async def dispatch(self, method, target, body):
+
+        parts = urlsplit(target)
+        query = parse_qs(parts.query)
+        allowed = False
+
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(parts.path)
+            if match:
+                if route_method == method:
+                    return await handler(query, body, *match.groups())
+                allowed = True
+
+        if allowed:
+            raise ApiError(405, "Method not allowed.")
+        raise ApiError(404, "Not found.")
+
+    async def handle(self, reader, writer):
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                status, reply = 200, None
+                length = int(headers.get("content-length", 0))
+                if length > max_body:
+                    status, reply = 413, {"error": "Request body too large."}
+                    raw = b""
+                else:
+                    raw = await reader.readexactly(length) if length else b""
+
+                if reply is None:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                        if not isinstance(body, dict):
+                            raise ApiError(400, "Expected a JSON object.")
+                        reply = await self.dispatch(method, target, body)
+                    except ScanError as error:
+                        status, reply = 409, {"error": str(error)}
+                    except ApiError as error:
+                        status, reply = error.status, {"error": str(error)}
+                    except ValueError as error:
+                        status, reply = 400, {"error": f"Bad request: {error}"}
+                    except Exception as error:
+                        status, reply = 500, {"error": str(error)}
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1" and status != 413
+                payload = json.dumps(reply).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {status_text[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+
+        self.commits = asyncio.Queue()
+        self.db.create_tables()
+
+        recovered = recover_journal(self.db, self.engine.journal)
+        if recovered:
+            print(f"Recovered {len(recovered)} scans from unfinished sessions.")
+        self.engine.catalog.ensure_loaded()
+
+        committer = asyncio.create_task(self.committer())
+        expiry = asyncio.create_task(self.expire_sessions())
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Checkout API listening on http://{host}:{port} (station {self.station})")
+        if ready is not None:
+            ready.set()
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            committer.cancel()
+            expiry.cancel()
+            self.writer.shutdown()
+            if self.group_sizes:
+                print(f"{sum(self.group_sizes)} commits in {len(self.group_sizes)} transactions")
+            self.db.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Serve the checkout engine over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--db", help="shared data.db other machines also open (journal_mode=DELETE, no WAL)")
+    parser.add_argument("--station", default="api")
+    options = parser.parse_args()
+
+    # Like the kiosk, a --db given on the command line is taken to be shared
+    # with stations on other machines; the default is this machine's own
+    local_path = Path(__file__).parent / "DB"
+    db_path = Path(options.db) if options.db else local_path / "data.db"
+    journal_path = local_path / f"session.{options.station}.journal"
+
+    try:
+        asyncio.run(ApiServer(db_path.resolve().as_uri(), options.station, journal_path, options.db is not None)
+            .serve(options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
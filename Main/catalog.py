@@ -0,0 +1,388 @@
+from datetime import datetime
+
+#-----Catalog Cache-----#
+# Process-wide copy of the equipment, availability and student tables so a
+# barcode scan can be answered without going back to SQLite. The cache loads
+# lazily on first use and is dropped whenever an admin screen commits. A SKU
+# or student ID missing from the cache is looked up once in the database in
+# case it was added after the cache was loaded. Locations committed by other
+# connections (the DB worker, other stations) are pulled in by sync() from
+# the avail change feed; an equipment or student change anywhere moves the
+# catalog change feed and makes sync() reload the whole cache.
+
+class Catalog:
+    def __init__(self, db):
+
+        self.db = db
+        self.loaded = False
+        self.equipment = {}
+        self.avail = {}
+        self.versions = {}
+        self.students = {}
+        self.data_version = None
+        self.last_seq = 0
+        self.catalog_seq = 0
+
+    def load(self):
+
+        self.data_version = self.db.fetchone("data_version")[0]
+        self.last_seq = self.db.fetchone("avail_last_change")[0]
+        self.catalog_seq = self.db.fetchone("catalog_last_change")[0]
+
+        self.equipment = {row[0]: row for row in self.db.fetchall("equipment_all")}
+        self.avail = {}
+        self.versions = {}
+        for SKU, location, version in self.db.fetchall("avail_all"):
+            self.avail[SKU] = location
+            self.versions[SKU] = version
+        self.students = {str(stu_ID): stu_name for stu_ID, stu_name in self.db.fetchall("students_all")}
+
+        self.loaded = True
+
+    def sync(self):
+
+        if not self.loaded:
+            return
+
+        data_version = self.db.fetchone("data_version")[0]
+        if data_version == self.data_version:
+            return
+
+        if self.db.fetchone("catalog_last_change")[0] != self.catalog_seq:
+            self.invalidate()
+            return
+
+        if self.db.fetchone("avail_first_change")[0] > self.last_seq + 1:
+            self.invalidate()
+            return
+
+        self.data_version = data_version
+        for SKU, location, version, seq in self.db.fetchall("avail_changed_versions", (self.last_seq,)):
+            if location is None:
+                self.avail.pop(SKU, None)
+                self.versions.pop(SKU, None)
+            else:
+                self.avail[SKU] = location
+                self.versions[SKU] = version
+            self.last_seq = max(self.last_seq, seq)
+
+    def invalidate(self):
+
+        self.loaded = False
+        self.equipment = {}
+        self.avail = {}
+        self.versions = {}
+        self.students = {}
+
+    def ensure_loaded(self):
+
+        if not self.loaded:
+            self.load()
+
+    def item(self, SKU):
+
+        self.ensure_loaded()
+        item = self.equipment.get(SKU)
+
+        if item is None:
+            row = self.db.fetchone("scan_lookup", (SKU,))
+            if row:
+                item = self.equipment[SKU] = row[:5]
+                if row[5] is not None:
+                    self.avail[SKU] = row[5]
+                    self.versions[SKU] = row[6]
+
+        return item
+
+    def name(self, SKU):
+
+        item = self.item(SKU)
+        return item[1] if item else None
+
+    def kit(self, SKU):
+
+        item = self.item(SKU)
+        return item[3] if item else None
+
+    def location(self, SKU):
+
+        if self.item(SKU) is None:
+            return None
+        return self.avail.get(SKU)
+
+    def version(self, SKU):
+
+        if self.item(SKU) is None:
+            return None
+        return self.versions.get(SKU)
+
+    def set_location(self, SKUs, location):
+
+        # Optimistic update after a commit is handed off; sync() replaces it
+        # with the stored values once the commit lands
+        if not self.loaded:
+            return
+
+        for SKU in SKUs:
+            if SKU in self.avail:
+                self.avail[SKU] = location
+                self.versions[SKU] = self.versions.get(SKU, 0) + 1
+
+    def student_name(self, stu_ID):
+
+        self.ensure_loaded()
+        stu_ID = str(stu_ID).strip()
+        stu_name = self.students.get(stu_ID)
+
+        if stu_name is None:
+            row = self.db.fetchone("student_lookup", (stu_ID,))
+            if row:
+                stu_name = self.students[stu_ID] = row[0]
+
+        return stu_name
+
+
+#-----Catalog Diff-----#
+# Admin saves compare the edited sheet with what is stored and write only the
+# rows that differ. Both sides are dicts keyed by the table's primary key.
+
+def clean_cell(value):
+
+    return "" if value is None else str(value).strip()
+
+
+def diff_rows(current, new):
+
+    added = {key: row for key, row in new.items() if key not in current}
+    changed = {key: row for key, row in new.items() if key in current and current[key] != row}
+    removed = [key for key in current if key not in new]
+
+    return added, changed, removed
+
+
+#-----Availability Search-----#
+# The trigram index needs at least three characters per term. Each term is
+# quoted so barcodes and model numbers like "24-105mm" are matched as plain
+# text, and the terms are ANDed. Shorter input falls back to a prefix LIKE.
+
+search_limit = 200
+min_search_term = 3
+
+
+def search_avail(db, text, limit=search_limit):
+
+    terms = [term for term in text.split() if len(term) >= min_search_term]
+
+    if terms:
+        expression = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        return db.fetchall("avail_search", (expression, limit))
+
+    pattern = text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return db.fetchall("avail_search_prefix", (pattern, pattern, limit))
+
+
+#-----Ledger Events-----#
+# Admin saves append their changes to the ledger and then re-project avail
+# for the SKUs whose row can have changed (by default every SKU in events).
+# events are (event, SKU, name, location, detail); see create_schema for what
+# each event means.
+
+equipment_fields = ("name", "category", "kit", "kit_parts")
+
+
+def record_events(db, events, SKUs=None):
+
+    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    db.executemany("ledger_insert", [(current_date, event, SKU, name, None, None, location, db.station, detail)
+        for event, SKU, name, location, detail in events])
+
+    if SKUs is None:
+        SKUs = dict.fromkeys(event[1] for event in events)
+    db.executemany("avail_delete", [(SKU,) for SKU in SKUs])
+    db.executemany("projection_apply", [(SKU,) for SKU in SKUs])
+
+
+#-----Equipment Save-----#
+# new_items maps SKU -> (name, category, kit, kit_parts). Only the differences
+# from the stored catalog are written, each as a catalog event, and avail
+# keeps the location of every SKU that is still in the catalog.
+
+def save_equipment(db, new_items):
+
+    current_items = {row[0]: tuple(clean_cell(value) for value in row[1:]) for row in db.fetchall("equipment_all")}
+
+    added, changed, removed = diff_rows(current_items, new_items)
+
+    db.executemany("equipment_insert",
+        [(item[0], SKU, item[1], item[2], item[3]) for SKU, item in added.items()])
+    db.executemany("equipment_update", [(*item, SKU) for SKU, item in changed.items()])
+    db.executemany("equipment_delete", [(SKU,) for SKU in removed])
+
+    # A catalog_change only carries a name (and so only re-projects avail)
+    # when the item was renamed
+    renamed = [SKU for SKU, item in changed.items() if item[0] != current_items[SKU][0]]
+    events = [("catalog_add", SKU, item[0], "in", None) for SKU, item in added.items()]
+    events += [("catalog_change", SKU, item[0] if SKU in renamed else None, None,
+        ", ".join(field for field, old, new in zip(equipment_fields, current_items[SKU], item) if old != new))
+        for SKU, item in changed.items()]
+    events += [("catalog_remove", SKU, current_items[SKU][0], None, None) for SKU in removed]
+    record_events(db, events, list(added) + renamed + removed)
+
+    db.executemany("kit_members_delete", [(SKU,) for SKU in list(changed) + removed])
+    db.executemany("kit_members_insert",
+        [member for SKU, item in list(added.items()) + list(changed.items()) for member in kit_member_rows(SKU, item[3])])
+
+    db.execute("import_equipment_clear", (db.station,))
+    db.commit()
+
+    return added, changed, removed
+
+
+#-----Availability Save-----#
+# rows are (SKU, name, location) from the Modify Availability sheet and
+# loaded maps SKU -> (name, location, version) as the sheet was filled. Every
+# row the admin changed, and every row deleted from the sheet, becomes an
+# override event. A SKU whose avail row has moved since the sheet was loaded
+# (a checkout at another station, say) is a conflict: it is left as it is
+# and returned so the sheet can be reloaded.
+
+def save_avail(db, rows, loaded):
+
+    new = {}
+    for SKU, name, location in rows:
+        SKU = clean_cell(SKU)
+        if SKU:
+            new[SKU] = (clean_cell(name), clean_cell(location))
+
+    return db.write(write_avail, new, loaded)
+
+
+def write_avail(db, new, loaded):
+
+    current = {SKU: (name, location, version) for name, SKU, location, version in db.fetchall("avail_list_versions")}
+    shown = {SKU: (clean_cell(name), clean_cell(location)) for SKU, (name, location, version) in loaded.items()}
+
+    added, changed, removed = diff_rows(shown, new)
+
+    conflicts = [SKU for SKU in list(added) + list(changed) + removed if current.get(SKU) != loaded.get(SKU)]
+    for SKU in conflicts:
+        added.pop(SKU, None)
+        changed.pop(SKU, None)
+    removed = [SKU for SKU in removed if SKU not in conflicts]
+
+    events = [("override", SKU, name, location, None) for SKU, (name, location) in added.items()]
+    events += [("override", SKU, name, location, f"was {current[SKU][1]}") for SKU, (name, location) in changed.items()]
+    events += [("override", SKU, current[SKU][0], None, "removed") for SKU in removed]
+    record_events(db, events)
+
+    return added, changed, removed, conflicts
+
+
+#-----Projection Rebuild-----#
+# Recomputes avail from the ledger alone. The rows that differed beforehand
+# are returned as (side, SKU, name, location, version), side being which of
+# ledger or avail held that version of the row.
+
+def audit_avail(db):
+
+    return db.fetchall("projection_drift")
+
+
+def rebuild_avail(db):
+
+    drift = audit_avail(db)
+    db.execute("avail_clear")
+    db.execute("projection_rebuild")
+    db.commit()
+
+    return drift
+
+
+#-----Checkout History-----#
+# Point-in-time questions about who had what, answered from the holdings
+# intervals. Times are "%Y-%m-%d %H:%M:%S" strings (or datetimes) like every
+# date the app stores; windows are [start, end). Rows are (SKU, name, stu_ID,
+# stu_name, out_date, in_date) with in_date None while the item is still out.
+
+history_date_format = "%Y-%m-%d %H:%M:%S"
+
+
+def history_date(when):
+
+    return when.strftime(history_date_format) if isinstance(when, datetime) else str(when)
+
+
+def holder_at(db, SKU, when):
+
+    # The last checkout at or before when is the only one that can cover it
+    when = history_date(when)
+    row = db.fetchone("holding_before", (SKU, when))
+    if row and (row[5] is None or row[5] > when):
+        return row
+    return None
+
+
+def holders_between(db, SKU, start, end):
+
+    start, end = history_date(start), history_date(end)
+    return [row for row in db.fetchall("holdings_SKU_between", (SKU, end, SKU, start))
+        if row[5] is None or row[5] > start]
+
+
+def held_by(db, stu_ID, start, end):
+
+    start, end = history_date(start), history_date(end)
+    stu_ID = str(stu_ID).strip()
+    return db.fetchall("holdings_student_between", (stu_ID, start, end, stu_ID, end))
+
+
+#-----Kit Membership-----#
+# equipment.kit_parts keeps the comma-joined text the admin sheet edits; the
+# kit_members rows derived from it are what the kit popup queries.
+
+def split_kit_parts(kit_parts):
+
+    parts = []
+    for part in clean_cell(kit_parts).split(","):
+        part = part.strip()
+        if part and part not in parts:
+            parts.append(part)
+    return parts
+
+
+def kit_member_rows(kit_SKU, kit_parts):
+
+    return [(kit_SKU, part, position) for position, part in enumerate(split_kit_parts(kit_parts))]
+
+
+#-----Student List Save-----#
+# Student edits are applied as an upsert/delete diff keyed on stu_ID, and
+# every added, renamed or removed ID is written to student_changes in the
+# same transaction.
+
+def save_students(db, new_students, remove_missing=True):
+
+    current_students = {clean_cell(stu_ID): clean_cell(stu_name) for stu_ID, stu_name in db.fetchall("students_all")}
+
+    added, changed, removed = diff_rows(current_students, new_students)
+    if not remove_missing:
+        removed = []
+
+    db.executemany("students_upsert", list(added.items()) + list(changed.items()))
+    db.executemany("students_delete", [(stu_ID,) for stu_ID in removed])
+
+    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    journal = [(current_date, stu_ID, "added", None, stu_name) for stu_ID, stu_name in added.items()]
+    journal += [(current_date, stu_ID, "renamed", current_students[stu_ID], stu_name) for stu_ID, stu_name in changed.items()]
+    journal += [(current_date, stu_ID, "removed", current_students[stu_ID], None) for stu_ID in removed]
+    db.executemany("student_changes_insert", journal)
+
+    db.commit()
+
+    return added, changed, removed
+
+
+def save_imported_students(db, new_students, remove_missing):
+
+    db.execute("import_students_clear", (db.station,))
+    return save_students(db, new_students, remove_missing)
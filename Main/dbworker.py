@@ -0,0 +1,105 @@
+import queue
+import threading
+import traceback
+from storage import Storage, default_station
+
+poll_interval = 20
+
+#-----Database Worker-----#
+# Commits, saves and imports run on one background thread with its own
+# connection, so the Tk event loop keeps drawing and taking scanner input
+# while SQLite works. Quick indexed reads stay on the main connection; WAL
+# lets them run alongside the worker's writes.
+#
+# Jobs are called as job(db, *args) on the worker thread (plus progress= when
+# the caller asked for progress). Results, errors and progress messages come
+# back through a queue that the Tk thread drains with after().
+
+class DBWorker:
+    def __init__(self, data_uri, station=default_station, shared=False):
+
+        self.data_uri = data_uri
+        self.shared = shared
+        self.station = station
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+        self.polling = False
+        self.widget = None
+        self.thread = None
+        self.db = None
+
+    def start(self, widget):
+
+        self.widget = widget
+        self.thread = threading.Thread(target=self.run, name="db-worker", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+
+        # The connection is opened by the first job, so an unreachable
+        # database fails that job instead of the thread
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+
+            job, args, callbacks = request
+            kwargs = {}
+            if callbacks["on_progress"] is not None:
+                kwargs["progress"] = lambda message, callbacks=callbacks: self.results.put(("progress", callbacks, message))
+
+            try:
+                if self.db is None:
+                    self.db = Storage(self.data_uri, self.station, self.shared)
+                result = job(self.db, *args, **kwargs)
+            except Exception as error:
+                if self.db is not None:
+                    self.db.con.rollback()
+                traceback.print_exc()
+                self.results.put(("error", callbacks, error))
+            else:
+                self.results.put(("done", callbacks, result))
+
+        if self.db is not None:
+            self.db.close()
+
+    def submit(self, job, *args, on_done=None, on_error=None, on_progress=None):
+
+        callbacks = {"on_done": on_done, "on_error": on_error, "on_progress": on_progress}
+        self.requests.put((job, args, callbacks))
+
+        self.pending += 1
+        if not self.polling:
+            self.polling = True
+            self.widget.after(poll_interval, self.poll)
+
+    def poll(self):
+
+        try:
+            while True:
+                try:
+                    kind, callbacks, value = self.results.get_nowait()
+                except queue.Empty:
+                    break
+
+                if kind == "progress":
+                    callbacks["on_progress"](value)
+                    continue
+
+                self.pending -= 1
+                callback = callbacks["on_done"] if kind == "done" else callbacks["on_error"]
+                if callback is not None:
+                    callback(value)
+        finally:
+            if self.pending:
+                self.widget.after(poll_interval, self.poll)
+            else:
+                self.polling = False
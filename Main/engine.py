@@ -0,0 +1,197 @@
+from catalog import Catalog
+from session import ScanJournal, ScanSession, commit_rows
+
+#-----Checkout Engine-----#
+# The check-in/check-out rules with no Tk in sight: who may start a session,
+# which scans are accepted, how a kit is checked off part by part, and how a
+# finished session reaches the ledger and avail. The GUI shows what scan()
+# returns and the messages of the ScanErrors it raises; scripts, benchmarks
+# or another front end can drive the same engine directly.
+#
+#     engine = Engine(Storage(data_uri), journal_path)
+#     session = engine.begin_session("12345", "out")
+#     session.scan("SKU0001")
+#     session.commit()
+
+actions = ("in", "out")
+
+# Where an item has to be before each action may take it
+required_location = {"in": "out", "out": "in"}
+
+
+class ScanError(Exception):
+    pass
+
+
+class ScanResult:
+    def __init__(self, kind, SKU, name=None, kit=None):
+
+        # kind is "item" (added to the session), "kit" (a kit's checklist was
+        # opened), "part" (a kit part was checked off) or "kit_done" (the
+        # last part was checked off and the kit was added to the session)
+        self.kind = kind
+        self.SKU = SKU
+        self.name = name
+        self.kit = kit
+
+
+#-----Kit Checklist-----#
+# outstanding holds the part SKUs still to scan, so checking one off is a
+# set lookup and completion is an empty set.
+
+class KitCheck:
+    def __init__(self, kit_SKU, kit_name, parts):
+
+        self.kit_SKU = kit_SKU
+        self.kit_name = kit_name
+        self.parts = [(SKU, name) for SKU, name in parts if name]
+        self.unknown = [SKU for SKU, name in parts if not name]
+        self.outstanding = {SKU for SKU, name in self.parts}
+
+    def __contains__(self, SKU):
+
+        return SKU in self.outstanding
+
+    @property
+    def complete(self):
+
+        return not self.outstanding
+
+    def check_off(self, SKU):
+
+        if SKU in self.outstanding:
+            self.outstanding.discard(SKU)
+        elif any(SKU == part_SKU for part_SKU, name in self.parts):
+            raise ScanError(f"Barcode {SKU} has already been scanned.")
+        else:
+            raise ScanError(f"Barcode {SKU} is not part of the kit.")
+
+
+#-----Checkout Session-----#
+class CheckoutSession:
+    def __init__(self, engine, stu_ID, action):
+
+        self.engine = engine
+        self.catalog = engine.catalog
+        self.stu_ID = stu_ID
+        self.action = action
+        self.scans = ScanSession(engine.db, engine.journal, stu_ID, action)
+        self.kit_check = None
+        self.conflicts = []
+
+    def __contains__(self, SKU):
+
+        return SKU in self.scans
+
+    def __len__(self):
+
+        return len(self.scans)
+
+    def scan(self, SKU):
+
+        SKU = str(SKU).strip()
+        if not SKU:
+            raise ScanError("No barcode scanned.")
+
+        if self.kit_check is not None:
+            return self.scan_part(SKU)
+
+        if SKU in self.scans:
+            raise ScanError("Same barcode scanned.")
+
+        name = self.catalog.name(SKU)
+        if not name:
+            raise ScanError("No equipment found.")
+
+        if self.catalog.location(SKU) != required_location[self.action]:
+            raise ScanError(f"Item {name} is not checked {required_location[self.action]}.")
+
+        kit_type = self.catalog.kit(SKU)
+        if not kit_type:
+            self.scans.add(SKU, self.catalog.version(SKU))
+            return ScanResult("item", SKU, name)
+
+        kit_type = kit_type.lower()
+        if kit_type == "kpart":
+            raise ScanError("Scanned item is a part of a kit.")
+        if kit_type != "kmain":
+            raise ScanError(f"Unknown kit type: {kit_type}.")
+
+        kit_check = KitCheck(SKU, name, self.engine.db.fetchall("kit_parts_list", (SKU,)))
+        if kit_check.complete:
+            raise ScanError("No kit parts found for kit.")
+
+        self.kit_check = kit_check
+        return ScanResult("kit", SKU, name, kit_check)
+
+    def scan_part(self, SKU):
+
+        kit_check = self.kit_check
+        kit_check.check_off(SKU)
+
+        if not kit_check.complete:
+            return ScanResult("part", SKU, kit=kit_check)
+
+        self.kit_check = None
+        self.scans.add(kit_check.kit_SKU, self.catalog.version(kit_check.kit_SKU))
+        return ScanResult("kit_done", kit_check.kit_SKU, kit_check.kit_name, kit_check)
+
+    def cancel_kit(self):
+
+        self.kit_check = None
+
+    def take(self):
+
+        # Hand over the accepted rows for committing elsewhere (the GUI's DB
+        # worker). The catalog cache is moved on straight away.
+        self.kit_check = None
+        rows = self.scans.take()
+        self.catalog.set_location([row[0] for row in rows], self.action)
+        return rows
+
+    def abandon(self):
+
+        # Drop the session without committing and hand back its scans; the
+        # caller takes them out of the journal
+        self.kit_check = None
+        return self.scans.take()
+
+    def discard(self):
+
+        # Abandon the session: nothing is committed and its scans leave the
+        # journal
+        self.engine.journal.discard(self.abandon())
+
+    def commit(self):
+
+        # Returns the committed SKUs; the ones another station committed
+        # first are left in conflicts
+        rows = self.take()
+        committed, conflicts = commit_rows(self.engine.db, rows)
+        self.engine.journal.discard(rows)
+
+        if conflicts:
+            self.catalog.sync()
+        self.conflicts = [row[0] for row in conflicts]
+        return [row[0] for row in committed]
+
+
+class Engine:
+    def __init__(self, db, journal, catalog=None):
+
+        self.db = db
+        self.journal = journal if isinstance(journal, ScanJournal) else ScanJournal(journal)
+        self.catalog = catalog if catalog is not None else Catalog(db)
+
+    def begin_session(self, stu_ID, action):
+
+        if action not in actions:
+            raise ValueError(f"Unknown action: {action}")
+
+        self.catalog.sync()
+
+        stu_ID = str(stu_ID).strip()
+        if not self.catalog.student_name(stu_ID):
+            raise ScanError("No matching student found.")
+
+        return CheckoutSession(self, stu_ID, action)
@@ -0,0 +1,193 @@
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+#-----Equipment Datasheet Import-----#
+# The barcode datasheet has a free-form preamble (kit notes, titles) above a
+# header row, and thousands of trailing rows that are nothing but commas. The
+# header row is found by its column names instead of a fixed line count, and
+# empty lines are dropped before the csv module ever parses them.
+
+eq_header = "Full Name"
+eq_columns = {
+    "name": "Full Name",
+    "category": "Category",
+    "kit": "Kit",
+    "SKU": "BARCODE/SKU",
+    "kit_parts": "Kit Barcodes/SKU",
+}
+eq_batch_size = 500
+
+
+def non_blank_lines(file):
+
+    for line in file:
+        if line.strip(", \t\r\n"):
+            yield line
+
+
+def find_eq_columns(reader):
+
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if cells and cells[0] == eq_header and all(col in cells for col in eq_columns.values()):
+            return {key: cells.index(col) for key, col in eq_columns.items()}
+
+    return None
+
+
+def read_eq_csv(path):
+
+    with open(path, mode='r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(non_blank_lines(file))
+        columns = find_eq_columns(reader)
+
+        if columns is None:
+            return
+
+        name_col = columns["name"]
+        category_col = columns["category"]
+        kit_col = columns["kit"]
+        SKU_col = columns["SKU"]
+        parts_col = columns["kit_parts"]
+        width = max(name_col, category_col, kit_col, SKU_col) + 1
+
+        for row in reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+
+            csv_SKU = row[SKU_col].strip()
+            if not csv_SKU:
+                continue
+
+            csv_name = row[name_col].strip()
+            csv_category = row[category_col].strip()
+            csv_kit = row[kit_col].strip()
+            csv_kit_parts = ",".join([part.strip() for part in row[parts_col:] if part.strip()])
+
+            yield (csv_name, csv_SKU, csv_category, csv_kit, csv_kit_parts)
+
+
+def import_equipment_csv(db, paths, batch_size=eq_batch_size, progress=None):
+
+    timings = {"parse": 0.0, "insert": 0.0, "commit": 0.0}
+    count = 0
+
+    insert_start = time.perf_counter()
+    db.execute("import_equipment_clear", (db.station,))
+    timings["insert"] += time.perf_counter() - insert_start
+
+    for path in paths:
+        rows = read_eq_csv(path)
+
+        while True:
+            parse_start = time.perf_counter()
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    break
+            timings["parse"] += time.perf_counter() - parse_start
+
+            if not batch:
+                break
+
+            insert_start = time.perf_counter()
+            db.executemany("import_equipment_insert", [(db.station, *row) for row in batch])
+            timings["insert"] += time.perf_counter() - insert_start
+            count += len(batch)
+
+            if progress is not None:
+                progress(f"Imported {count} items from {path.name}")
+
+    commit_start = time.perf_counter()
+    db.commit()
+    timings["commit"] = time.perf_counter() - commit_start
+
+    return count, timings
+
+
+def format_timings(label, count, timings):
+
+    phases = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in timings.items())
+    return f"{label}: {count} rows ({phases})"
+
+
+#-----Student Roster Import-----#
+# Skyward class roster exports are parsed, then the students are merged by
+# ID here and written with a single executemany. Rosters are small, so they
+# are read in this process unless together they pass parallel_roster_bytes;
+# only then does each file get a worker process. Workers are spawned rather
+# than forked, since the caller is a threaded Tk program.
+
+roster_id_header = "Student ID"
+parallel_roster_bytes = 8 * 1024 * 1024
+
+
+def read_roster_csv(path):
+
+    students = []
+
+    with open(path, mode='r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.reader(non_blank_lines(file))
+
+        id_col = None
+        for row in reader:
+            cells = [cell.strip() for cell in row]
+            if roster_id_header in cells:
+                id_col = cells.index(roster_id_header)
+                break
+
+        if id_col is None:
+            return students
+
+        for row in reader:
+            if len(row) > id_col and row[0].strip() and row[id_col].strip():
+                students.append((row[id_col].strip(), row[0].strip()))
+
+    return students
+
+
+def read_roster_csvs(paths, workers=None):
+
+    if len(paths) < 2 or sum(os.path.getsize(path) for path in paths) < parallel_roster_bytes:
+        return [read_roster_csv(path) for path in paths]
+
+    workers = min(len(paths), workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(read_roster_csv, paths))
+
+
+def import_roster_csvs(db, paths, workers=None, progress=None):
+
+    timings = {"parse": 0.0, "merge": 0.0, "insert": 0.0, "commit": 0.0}
+
+    if progress is not None:
+        progress(f"Reading {len(paths)} roster files")
+
+    parse_start = time.perf_counter()
+    rosters = read_roster_csvs(paths, workers)
+    timings["parse"] = time.perf_counter() - parse_start
+
+    if progress is not None:
+        progress(f"Saving {sum(len(roster) for roster in rosters)} roster rows")
+
+    merge_start = time.perf_counter()
+    students = {}
+    for roster in rosters:
+        for stu_ID, stu_name in roster:
+            students.setdefault(stu_ID, stu_name)
+    timings["merge"] = time.perf_counter() - merge_start
+
+    insert_start = time.perf_counter()
+    db.execute("import_students_clear", (db.station,))
+    db.executemany("import_students_insert", [(db.station, stu_ID, stu_name) for stu_ID, stu_name in students.items()])
+    timings["insert"] = time.perf_counter() - insert_start
+
+    commit_start = time.perf_counter()
+    db.commit()
+    timings["commit"] = time.perf_counter() - commit_start
+
+    return len(students), timings
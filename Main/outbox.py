@@ -0,0 +1,271 @@
+import json
+import queue
+import sqlite3 as sql
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from session import prepare_rows, write_session
+from storage import Storage, busy_timeout
+
+sync_interval = 2.0
+sync_batch = 50
+max_backoff = 60.0
+
+#-----Station Outbox-----#
+# With --outbox a station does not write finished sessions to the shared
+# database itself. It appends them to a small SQLite file on local disk and
+# carries on; a SyncWorker thread replays the outbox into the central
+# database whenever it can reach it. Every session gets a UUID that is
+# recorded in central synced_sessions in the same transaction as its rows,
+# so a replay interrupted between the central commit and marking the outbox
+# is simply recognised the next time round.
+#
+# The outbox runs with synchronous=FULL: once add() returns the session is
+# on disk, which is what lets the checkout be acknowledged straight away.
+# Scanning itself reads a local replica of the catalog (see refresh_replica).
+
+outbox_pragmas = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = FULL",
+    f"PRAGMA busy_timeout = {busy_timeout}",
+)
+
+
+class Outbox:
+    def __init__(self, path):
+
+        self.con = sql.connect(path, timeout=busy_timeout / 1000)
+        self.cur = self.con.cursor()
+
+        for pragma in outbox_pragmas:
+            self.cur.execute(pragma)
+
+        self.cur.execute("""CREATE TABLE IF NOT EXISTS outbox(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT UNIQUE NOT NULL,
+                    station TEXT NOT NULL,
+                    created TEXT NOT NULL,
+                    rows TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    conflicts TEXT,
+                    synced TEXT
+                    )""")
+        self.cur.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, id)")
+        self.con.commit()
+
+    def add(self, station, rows):
+
+        session_id = uuid.uuid4().hex
+        self.cur.execute("INSERT INTO outbox (session_id, station, created, rows) VALUES (?, ?, ?, ?)",
+            (session_id, station, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(rows)))
+        self.con.commit()
+        return session_id
+
+    def entries(self, statuses, limit=-1):
+
+        marks = ", ".join("?" * len(statuses))
+        return [(id, session_id, station, [tuple(row) for row in json.loads(rows)])
+            for id, session_id, station, rows in self.cur.execute(
+                f"SELECT id, session_id, station, rows FROM outbox WHERE status IN ({marks}) ORDER BY id LIMIT ?",
+                (*statuses, limit)).fetchall()]
+
+    def pending(self, limit=sync_batch):
+
+        return self.entries(("pending",), limit)
+
+    def mark_attempt(self, ids):
+
+        self.cur.executemany("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(id,) for id in ids])
+        self.con.commit()
+
+    def mark_synced(self, results):
+
+        # results: [(id, conflicting SKUs)]
+        synced = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.cur.executemany("UPDATE outbox SET status = ?, conflicts = ?, synced = ? WHERE id = ?",
+            [("conflict" if conflicts else "synced", json.dumps(sorted(conflicts)), synced, id)
+                for id, conflicts in results])
+        self.con.commit()
+
+    def counts(self):
+
+        return dict(self.cur.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def close(self):
+
+        self.con.close()
+
+
+#-----Central Replay-----#
+def replay_session(db, session_id, station, rows):
+
+    # Returns the SKUs that conflicted, now or on an earlier replay
+    row = db.fetchone("synced_session_lookup", (session_id,))
+    if row:
+        return set(json.loads(row[0]))
+
+    conflicts = write_session(db, prepare_rows(rows))
+    db.execute("synced_session_insert",
+        (session_id, station, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(sorted(conflicts))))
+    return conflicts
+
+
+def replay_entries(db, entries):
+
+    return [replay_session(db, session_id, station, rows) for id, session_id, station, rows in entries]
+
+
+#-----Station Replica-----#
+# In outbox mode the station scans against a local copy of the catalog
+# (equipment, kit parts, students and avail) instead of the central database,
+# so neither startup nor a scan waits on the network. The sync worker brings
+# the copy up to date whenever central has changed, writing only the rows
+# that differ so the replica's avail change feed (and with it the station's
+# catalog cache) sees just those.
+
+replica_tables = (
+    ("equipment", ("SKU",), ("name", "category", "kit", "kit_parts")),
+    ("kit_members", ("kit_SKU", "part_SKU"), ("position",)),
+    ("students", ("stu_ID",), ("stu_name",)),
+    ("avail", ("SKU",), ("name", "location", "version")),
+)
+
+
+def refresh_replica(replica, central_uri):
+
+    cur = replica.cur
+    cur.execute("ATTACH DATABASE ? AS central", (central_uri,))
+    try:
+        cur.execute("BEGIN")
+        for table, keys, values in replica_tables:
+            key = ", ".join(keys)
+            columns = ", ".join(keys + values)
+            cur.execute(f"DELETE FROM main.{table} WHERE ({key}) NOT IN (SELECT {key} FROM central.{table})")
+            cur.execute(f"""INSERT INTO main.{table} ({columns})
+                SELECT {columns} FROM central.{table} EXCEPT SELECT {columns} FROM main.{table}
+                ORDER BY 1 ON CONFLICT ({key}) DO UPDATE SET
+                {", ".join(f"{value} = excluded.{value}" for value in values)}""")
+        replica.commit()
+    finally:
+        if replica.con.in_transaction:
+            replica.con.rollback()
+        cur.execute("DETACH DATABASE central")
+
+
+#-----Sync Worker-----#
+# Replays pending outbox entries in batches, one central transaction per
+# batch. If the central database cannot be reached the worker backs off
+# (doubling up to max_backoff) and tries again; nothing is lost because the
+# entries stay pending. Sessions that conflicted are put on reports as
+# (session_id, SKUs) for the station to show. With replica_path the worker
+# also keeps the station replica in step with central.
+
+class SyncWorker:
+    def __init__(self, central_uri, outbox_path, station, interval=sync_interval, replica_path=None, shared=False):
+
+        self.central_uri = central_uri
+        self.shared = shared
+        self.outbox_path = outbox_path
+        self.station = station
+        self.interval = interval
+        self.replica_path = replica_path
+        self.central_version = None
+        self.reports = queue.Queue()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.synced = 0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.run, name="outbox-sync", daemon=True)
+        self.thread.start()
+
+    def wake(self):
+
+        self.wakeup.set()
+
+    def stop(self):
+
+        if self.thread is not None:
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+
+    def sync_once(self, outbox, central):
+
+        # Returns how many entries were replayed
+        entries = outbox.pending()
+        if not entries:
+            return 0
+
+        outbox.mark_attempt([entry[0] for entry in entries])
+        conflicts = central.write(replay_entries, entries)
+        outbox.mark_synced([(entry[0], skipped) for entry, skipped in zip(entries, conflicts)])
+
+        for entry, skipped in zip(entries, conflicts):
+            if skipped:
+                self.reports.put((entry[1], sorted(skipped)))
+
+        self.synced += len(entries)
+        return len(entries)
+
+    def sync_replica(self, replica, central, replayed):
+
+        # Only when this worker has just replayed sessions or another
+        # connection has committed to central since last time
+        central_version = central.fetchone("data_version")[0]
+        if replayed or central_version != self.central_version:
+            refresh_replica(replica, self.central_uri)
+            self.central_version = central_version
+
+    def run(self):
+
+        outbox = Outbox(self.outbox_path)
+        replica = Storage(Path(self.replica_path).resolve().as_uri(), self.station) if self.replica_path else None
+        central = None
+        backoff = self.interval
+
+        while not self.stopping:
+            self.wakeup.clear()
+            try:
+                if central is None:
+                    central = Storage(self.central_uri, self.station, self.shared)
+                    central.create_tables()
+                    self.central_version = None
+
+                replayed = self.sync_once(outbox, central)
+                if replica is not None:
+                    self.sync_replica(replica, central, replayed)
+                if self.last_error is not None:
+                    print("Outbox sync resumed")
+                    self.last_error = None
+
+                if replayed:
+                    backoff = self.interval
+                    continue
+            except sql.Error as error:
+                if self.last_error is None:
+                    print(f"Outbox sync paused, central database unavailable: {error}")
+                self.failures += 1
+                self.last_error = error
+                if central is not None:
+                    central.close()
+                    central = None
+                backoff = min(backoff * 2, max_backoff)
+                self.wakeup.wait(backoff)
+                continue
+
+            self.wakeup.wait(self.interval)
+
+        if central is not None:
+            central.close()
+        if replica is not None:
+            replica.close()
+        outbox.close()
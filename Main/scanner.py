@@ -0,0 +1,145 @@
+import tkinter
+from collections import deque
+
+# A USB barcode scanner types a whole barcode in a few milliseconds and ends
+# it with Return. Keys closer together than scan_key_gap count as one burst
+# of scanner input, and a longer pause starts a new one, so stray keys
+# before a scan never end up in front of the barcode. A burst that stops
+# without a Return is taken as a complete barcode too (scanners set up
+# without an Enter suffix). A Return after keys typed by hand submits what
+# was typed into the focused entry instead.
+scan_key_gap = 40
+scan_idle = 120
+min_scan_length = 3
+end_keys = ("Return", "KP_Enter")
+
+#-----Scan Capture-----#
+# Keystrokes are read with bind_all, so they are caught whatever widget has
+# focus, including while an error popup holds the grab. Complete barcodes go
+# into a queue that is handed to the current target one per idle callback,
+# in scan order, so a burst of scans is never dropped or handled out of turn.
+#
+# Targets form a stack: the check-in/out frame sets its handler when it
+# opens and the kit popup pushes its own on top, so the scans that follow a
+# kit go to the popup as soon as it exists.
+
+class ScanCapture:
+    def __init__(self):
+
+        self.widget = None
+        self.targets = []
+        self.queue = deque()
+        self.buffer = []
+        self.last_key = None
+        self.idle_job = None
+        self.drain_job = None
+
+    def start(self, widget):
+
+        self.widget = widget
+        widget.bind_all("<KeyPress>", self.key_press, add="+")
+
+    def clear(self):
+
+        self.targets = []
+        self.queue.clear()
+        self.reset_buffer()
+
+    def set_target(self, target):
+
+        self.clear()
+        self.targets.append(target)
+
+    def push(self, target):
+
+        self.targets.append(target)
+
+    def pop(self, target):
+
+        if target in self.targets:
+            self.targets.remove(target)
+
+    def reset_buffer(self):
+
+        self.buffer = []
+        self.last_key = None
+
+        if self.idle_job is not None:
+            self.widget.after_cancel(self.idle_job)
+            self.idle_job = None
+
+    def key_press(self, event):
+
+        if not self.targets:
+            return
+
+        if event.keysym in end_keys:
+            if len(self.buffer) < min_scan_length:
+                self.buffer = list(self.typed_text(event))
+            self.flush()
+            return
+
+        if event.keysym == "BackSpace":
+            if self.buffer:
+                self.buffer.pop()
+            return
+
+        if not event.char or not event.char.isprintable():
+            return
+
+        # event.time is when the key was pressed, not when Tk got round to
+        # it, so the gaps stay accurate while the UI is busy
+        if self.last_key is not None and event.time - self.last_key > scan_key_gap:
+            if len(self.buffer) >= min_scan_length:
+                self.flush()
+            else:
+                self.reset_buffer()
+        self.last_key = event.time
+        self.buffer.append(event.char)
+
+        if self.idle_job is not None:
+            self.widget.after_cancel(self.idle_job)
+        self.idle_job = self.widget.after(scan_idle, self.idle_flush)
+
+    def idle_flush(self):
+
+        self.idle_job = None
+        if len(self.buffer) >= min_scan_length:
+            self.flush()
+
+    def typed_text(self, event):
+
+        # A barcode keyed in by hand: Return goes to the entry it was typed in
+        if isinstance(event.widget, tkinter.Entry):
+            return event.widget.get()
+        return ""
+
+    def flush(self):
+
+        barcode = "".join(self.buffer).strip()
+        self.reset_buffer()
+
+        if barcode:
+            self.queue.append(barcode)
+            if self.drain_job is None:
+                self.drain_job = self.widget.after_idle(self.drain_one)
+
+    def drain_one(self):
+
+        self.drain_job = None
+
+        if self.queue and self.targets:
+            self.targets[-1](self.queue.popleft())
+
+        if self.queue and self.targets:
+            self.drain_job = self.widget.after_idle(self.drain_one)
+
+    def drain(self):
+
+        # Handle everything still queued right away, e.g. before "Done"
+        if self.drain_job is not None:
+            self.widget.after_cancel(self.drain_job)
+            self.drain_job = None
+
+        while self.queue and self.targets:
+            self.targets[-1](self.queue.popleft())
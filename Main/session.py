@@ -0,0 +1,184 @@
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+#-----Scan Journal-----#
+# Accepted scans are held in memory until "Done". Each one is also appended
+# to a small journal file (flushed, not fsynced) so a crash or power cut in
+# the middle of a session loses nothing; the journal is emptied once the
+# session has been written to the database. Given an executor (the API
+# server's writer thread) append() queues the write there instead of doing
+# it on the caller's thread, in order with the discards queued after it.
+# Every file operation holds the journal's lock.
+
+class ScanJournal:
+    def __init__(self, path, executor=None):
+
+        self.path = Path(path)
+        self.file = None
+        self.lock = threading.Lock()
+        self.executor = executor
+
+    def append(self, row):
+
+        if self.executor is not None:
+            self.executor.submit(self.write, row)
+        else:
+            self.write(row)
+
+    def write(self, row):
+
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, mode='a', encoding='utf-8')
+
+            self.file.write(json.dumps(row) + "\n")
+            self.file.flush()
+
+    def read(self):
+
+        if not self.path.exists():
+            return []
+
+        rows = []
+        with open(self.path, mode='r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except ValueError:
+                    break
+        return rows
+
+    def discard(self, rows):
+
+        # Drop the scans of a session that has just been committed and keep
+        # anything else, e.g. the next student's scans made in the meantime
+        committed = {}
+        for row in rows:
+            line = json.dumps(row) + "\n"
+            committed[line] = committed.get(line, 0) + 1
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+            if not self.path.exists():
+                return
+
+            kept = []
+            with open(self.path, mode='r', encoding='utf-8') as file:
+                for line in file:
+                    if committed.get(line):
+                        committed[line] -= 1
+                    else:
+                        kept.append(line)
+
+            with open(self.path, mode='w', encoding='utf-8') as file:
+                file.writelines(kept)
+
+    def clear(self):
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+            open(self.path, mode='w', encoding='utf-8').close()
+
+
+#-----Session Commit-----#
+# Scanned rows are staged in temp under this station's name and copied to
+# the ledger (as checkout / checkin events) and avail inside the same
+# transaction, so a whole session costs one commit. Each row carries the
+# avail.version seen at scan time; a row whose item has been committed by
+# another station since then is a conflict and is left out, so two stations
+# can never both check out the same SKU.
+
+def write_session(db, rows):
+
+    station = db.station
+
+    db.execute("session_clear", (station,))
+    db.executemany("session_insert", [(station, *row) for row in rows])
+    conflicts = {SKU for (SKU,) in db.fetchall("session_conflicts", (station,))}
+    db.execute("session_drop_conflicts", (station,))
+    db.execute("session_commit_ledger", (station,))
+    db.execute("session_commit_avail", (station,))
+    db.execute("session_clear", (station,))
+
+    return conflicts
+
+
+def prepare_rows(rows):
+
+    # Journals written before version checks have four fields per row
+    rows = [tuple(row) if len(row) > 4 else (*row, None) for row in rows]
+    return list({row[0]: row for row in rows}.values())
+
+
+def write_sessions(db, groups):
+
+    return [write_session(db, rows) if rows else set() for rows in groups]
+
+
+def commit_groups(db, groups):
+
+    # Commit several sessions in one transaction (the API server's group
+    # commit). Sessions are written in order, so when two of them hold the
+    # same SKU the later one gets the conflict.
+    prepared = [prepare_rows(rows) for rows in groups]
+
+    if not any(prepared):
+        return [([], []) for rows in prepared]
+
+    conflicts = db.write(write_sessions, prepared)
+    return [([row for row in rows if row[0] not in skipped], [row for row in rows if row[0] in skipped])
+        for rows, skipped in zip(prepared, conflicts)]
+
+
+def commit_rows(db, rows):
+
+    return commit_groups(db, [rows])[0]
+
+
+def recover_journal(db, journal):
+
+    committed, conflicts = commit_rows(db, journal.read())
+    journal.clear()
+    return committed
+
+
+#-----Scan Session-----#
+class ScanSession:
+    def __init__(self, db, journal, stu_ID, location):
+
+        self.db = db
+        self.journal = journal
+        self.stu_ID = stu_ID
+        self.location = location
+        self.rows = {}
+
+    def __contains__(self, SKU):
+
+        return SKU in self.rows
+
+    def __len__(self):
+
+        return len(self.rows)
+
+    def add(self, SKU, version=None):
+
+        current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row = (SKU, self.stu_ID, current_date, self.location, version)
+
+        self.journal.append(row)
+        self.rows[SKU] = row
+        return row
+
+    def take(self):
+
+        rows = list(self.rows.values())
+        self.rows = {}
+        return rows
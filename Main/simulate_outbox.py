@@ -0,0 +1,118 @@
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from engine import Engine, ScanError
+from outbox import Outbox, SyncWorker, refresh_replica, replay_entries
+from simulate_stations import build_database, check_history
+from storage import Storage
+
+#-----Outbox Simulation-----#
+# Each station has a local outbox and a local replica of the catalog next to
+# one central database. Stations keep checking items out and in against
+# their replica while their sessions only go to the outbox; the central
+# database is "unreachable" for the first part of the run, so the sync
+# workers have to back off and catch up. At the end every outbox is replayed a second time by hand to show the
+# replay is idempotent, and the central history is checked.
+#
+#     python Main/simulate_outbox.py --stations 2 --sessions 300
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Simulate station outboxes syncing into a central database.")
+    parser.add_argument("--stations", type=int, default=2)
+    parser.add_argument("--sessions", type=int, default=300, help="sessions per station")
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--outage", type=float, default=1.0, help="seconds the central database is unreachable")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        folder = Path(folder)
+        central_path = folder / "central.db"
+        build_database(central_path, options.items)
+        central_uri = central_path.resolve().as_uri()
+        unreachable_uri = (folder / "offline" / "central.db").resolve().as_uri()
+
+        stations = []
+        for n in range(options.stations):
+            name = f"station-{n + 1}"
+            outbox_path = folder / f"outbox.{name}.db"
+            replica_path = folder / f"replica.{name}.db"
+
+            # The station synced once before the outage
+            replica = Storage(replica_path.resolve().as_uri(), name)
+            replica.create_tables()
+            refresh_replica(replica, central_uri)
+
+            engine = Engine(replica, folder / f"session.{name}.journal")
+            sync = SyncWorker(unreachable_uri, outbox_path, name, interval=0.05, replica_path=replica_path)
+            sync.start()
+            stations.append((name, engine, Outbox(outbox_path), sync))
+
+        # Stations read their replica (as it stands after whatever has synced
+        # so far) and only ever write to their own outbox
+        started = time.perf_counter()
+        acknowledged = []
+        for _ in range(options.sessions):
+            for name, engine, outbox, sync in stations:
+                engine.catalog.ensure_loaded()
+                session = engine.begin_session(random.choice(list(engine.catalog.students)), random.choice(("in", "out")))
+                for SKU in random.sample(list(engine.catalog.equipment), 3):
+                    try:
+                        session.scan(SKU)
+                    except ScanError:
+                        pass
+                if len(session):
+                    tick = time.perf_counter()
+                    outbox.add(name, session.take())
+                    acknowledged.append(time.perf_counter() - tick)
+                    sync.wake()
+
+            if time.perf_counter() - started > options.outage:
+                for name, engine, outbox, sync in stations:
+                    sync.central_uri = central_uri
+
+        for name, engine, outbox, sync in stations:
+            sync.central_uri = central_uri
+        while any(outbox.counts().get("pending") for name, engine, outbox, sync in stations):
+            for name, engine, outbox, sync in stations:
+                sync.wake()
+            time.sleep(0.05)
+
+        for name, engine, outbox, sync in stations:
+            sync.stop()
+
+        acknowledged.sort()
+        print(f"{len(acknowledged)} sessions acknowledged from the outbox, "
+              f"p50 {acknowledged[len(acknowledged) // 2] * 1000:.2f} ms, max {acknowledged[-1] * 1000:.2f} ms")
+        for name, engine, outbox, sync in stations:
+            print(f"{name}: {outbox.counts()}, {sync.failures} failed sync attempts while offline")
+
+        # Replaying everything again must not add a single ledger event
+        central = Storage(central_uri, "check")
+        before = central.cur.execute("SELECT COUNT(*) FROM ledger").fetchone()[0]
+        for name, engine, outbox, sync in stations:
+            central.write(replay_entries, outbox.entries(("synced", "conflict")))
+        after = central.cur.execute("SELECT COUNT(*) FROM ledger").fetchone()[0]
+
+        print(f"ledger events {before}, after replaying every outbox again {after}")
+
+        central_avail = central.cur.execute("SELECT SKU, name, location, version FROM avail ORDER BY SKU").fetchall()
+        for name, engine, outbox, sync in stations:
+            refresh_replica(engine.db, central_uri)
+            replica_avail = engine.db.cur.execute("SELECT SKU, name, location, version FROM avail ORDER BY SKU").fetchall()
+            print(f"{name} replica {'matches' if replica_avail == central_avail else 'differs from'} central")
+        broken = check_history(central_uri)
+        print("history consistent" if not broken else f"double checkouts for {len(broken)} SKUs")
+
+        central.close()
+        for name, engine, outbox, sync in stations:
+            outbox.close()
+            engine.db.close()
+
+
+if __name__ == "__main__":
+    main()
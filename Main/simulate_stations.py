@@ -0,0 +1,130 @@
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+from engine import Engine, ScanError
+from storage import Storage
+from catalog import save_equipment, save_students
+
+#-----Multi-Station Simulation-----#
+# Drives N checkout stations against one database, each in its own process
+# with its own connection, as separate kiosks would. Every station keeps
+# checking random items out and back in from a shared pool small enough for
+# stations to collide, then the totals are reported along with a check that
+# no item was ever checked out twice without a check-in in between.
+#
+#     python Main/simulate_stations.py --stations 3 --seconds 10
+#
+# With --db the database is copied first; the original is never written.
+
+student_count = 50
+
+
+def build_database(path, items):
+
+    db = Storage(Path(path).resolve().as_uri(), "setup")
+    db.create_tables()
+    save_equipment(db, {f"SIM{i:05d}": (f"Simulated item {i}", "Sim", "", "") for i in range(items)})
+    save_students(db, {str(1000 + i): f"Student {i}" for i in range(student_count)})
+    db.close()
+
+
+def run_station(args):
+
+    data_uri, station, seconds, batch, seed = args
+    random.seed(seed)
+
+    db = Storage(data_uri, station)
+    journal = Path(tempfile.gettempdir()) / f"sim.{station}.journal"
+    engine = Engine(db, journal)
+
+    engine.catalog.ensure_loaded()
+    SKUs = list(engine.catalog.equipment)
+    students = list(engine.catalog.students)
+    stats = {"sessions": 0, "committed": 0, "conflicts": 0, "rejected": 0}
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        session = engine.begin_session(random.choice(students), random.choice(("in", "out")))
+
+        for SKU in random.sample(SKUs, min(batch, len(SKUs))):
+            try:
+                session.scan(SKU)
+            except ScanError:
+                stats["rejected"] += 1
+
+        if len(session):
+            stats["committed"] += len(session.commit())
+            stats["conflicts"] += len(session.conflicts)
+            stats["sessions"] += 1
+
+    stats["busy_retries"] = db.busy_retries
+    db.close()
+    journal.unlink(missing_ok=True)
+    return station, stats
+
+
+def check_history(data_uri):
+
+    # Per SKU, the checkout and checkin events must alternate out / in
+    db = Storage(data_uri, "check")
+    rows = db.cur.execute("""SELECT SKU, location FROM ledger WHERE event IN ('checkout', 'checkin')
+        ORDER BY SKU, seq""").fetchall()
+    db.close()
+
+    broken = set()
+    previous = {}
+    for SKU, location in rows:
+        if previous.get(SKU, "in") == location:
+            broken.add(SKU)
+        previous[SKU] = location
+    return broken
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Simulate several checkout stations sharing one database.")
+    parser.add_argument("--stations", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--items", type=int, default=40, help="size of the shared item pool")
+    parser.add_argument("--batch", type=int, default=5, help="items scanned per session")
+    parser.add_argument("--db", help="existing database to copy instead of a generated one")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "stations.db"
+        if options.db:
+            shutil.copyfile(options.db, path)
+            Storage(path.resolve().as_uri(), "setup").create_tables()
+        else:
+            build_database(path, options.items)
+        data_uri = path.resolve().as_uri()
+
+        jobs = [(data_uri, f"station-{n + 1}", options.seconds, options.batch, n) for n in range(options.stations)]
+        started = time.perf_counter()
+        with Pool(options.stations) as pool:
+            results = pool.map(run_station, jobs)
+        elapsed = time.perf_counter() - started
+
+        totals = {}
+        for station, stats in results:
+            print(f"{station}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+
+        attempted = totals["committed"] + totals["conflicts"]
+        print(f"{totals['sessions'] / elapsed:.0f} sessions/s, {totals['committed'] / elapsed:.0f} committed scans/s"
+              f" over {elapsed:.1f} s")
+        print(f"conflict rate {totals['conflicts'] / attempted * 100 if attempted else 0:.2f}%"
+              f" of committed rows, {totals['busy_retries']} busy retries")
+
+        broken = check_history(data_uri)
+        print("history consistent" if not broken else f"double checkouts for {len(broken)} SKUs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+import sqlite3 as sql
+import socket
+import time
+from catalog import kit_member_rows
+
+#-----Connection Settings-----#
+# WAL lets the Availability screen read while a checkout is committing, and
+# synchronous=NORMAL only syncs at checkpoints instead of on every commit.
+# WAL needs shared memory on one host, so a database that stations on other
+# machines open over a network share (shared=True) keeps the rollback
+# journal and syncs every commit instead.
+
+busy_timeout = 5000
+write_retries = 5
+# SQLITE_BUSY and SQLITE_LOCKED (the sqlite3 constants need Python 3.11)
+busy_codes = (5, 6)
+write_retry_delay = 0.05
+default_station = socket.gethostname()
+
+# Bump whenever create_schema changes, so existing databases run it again
+schema_version = 7
+avail_change_keep = 10000
+local_pragmas = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+)
+shared_pragmas = (
+    "PRAGMA journal_mode = DELETE",
+    "PRAGMA synchronous = FULL",
+)
+pragmas = (
+    "PRAGMA cache_size = -8000",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {busy_timeout}",
+)
+
+#-----Query Registry-----#
+# Every statement the app runs lives here under a name. sqlite3 keeps the
+# compiled form of each string in the connection's statement cache, so the
+# hot ones (scan lookup, session insert, session commit) are only prepared
+# once per process.
+
+queries = {
+    # Checkout session (temp rows belong to one station; version is the
+    # avail.version the station saw when the item was scanned)
+    "session_insert": """INSERT INTO temp (station, SKU, stu_ID, date, location, version)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+    "session_clear": "DELETE FROM temp WHERE station = ?",
+    "session_conflicts": """SELECT SKU FROM temp WHERE station = ? AND version IS NOT NULL
+        AND version != (SELECT avail.version FROM avail WHERE avail.SKU = temp.SKU)""",
+    "session_drop_conflicts": """DELETE FROM temp WHERE station = ? AND version IS NOT NULL
+        AND version != (SELECT avail.version FROM avail WHERE avail.SKU = temp.SKU)""",
+    "session_commit_ledger": """INSERT INTO ledger (date, event, SKU, name, stu_ID, stu_name, location, station)
+        SELECT temp.date, CASE temp.location WHEN 'out' THEN 'checkout' ELSE 'checkin' END,
+            temp.SKU, avail.name, temp.stu_ID, students.stu_name, temp.location, temp.station
+        FROM temp
+        JOIN avail ON temp.SKU = avail.SKU
+        LEFT JOIN students ON temp.stu_ID = students.stu_ID
+        WHERE temp.station = ?""",
+    "session_commit_avail": """UPDATE avail SET location = temp.location, version = avail.version + 1
+        FROM temp WHERE avail.SKU = temp.SKU AND temp.station = ?""",
+
+    # Outbox replay (sessions already applied from a station outbox)
+    "synced_session_lookup": "SELECT conflicts FROM synced_sessions WHERE session_id = ?",
+    "synced_session_insert": """INSERT INTO synced_sessions (session_id, station, synced, conflicts)
+        VALUES (?, ?, ?, ?)""",
+
+    # Scan lookup
+    "scan_lookup": """SELECT equipment.SKU, equipment.name, equipment.category, equipment.kit,
+        equipment.kit_parts, avail.location, avail.version
+        FROM equipment LEFT JOIN avail ON avail.SKU = equipment.SKU
+        WHERE equipment.SKU = ?""",
+    "student_lookup": "SELECT stu_name FROM students WHERE stu_ID = ?",
+
+    # Catalog
+    "equipment_all": "SELECT SKU, name, category, kit, kit_parts FROM equipment",
+    "equipment_insert": "INSERT INTO equipment (name, SKU, category, kit, kit_parts) VALUES (?, ?, ?, ?, ?)",
+    "equipment_update": "UPDATE equipment SET name = ?, category = ?, kit = ?, kit_parts = ? WHERE SKU = ?",
+    "equipment_delete": "DELETE FROM equipment WHERE SKU = ?",
+    "kit_parts_list": """SELECT kit_members.part_SKU, equipment.name FROM kit_members
+        LEFT JOIN equipment ON equipment.SKU = kit_members.part_SKU
+        WHERE kit_members.kit_SKU = ? ORDER BY kit_members.position""",
+    "kit_members_insert": "INSERT OR IGNORE INTO kit_members (kit_SKU, part_SKU, position) VALUES (?, ?, ?)",
+    "kit_members_delete": "DELETE FROM kit_members WHERE kit_SKU = ?",
+    "avail_all": "SELECT SKU, location, version FROM avail",
+    "avail_list": "SELECT name, SKU, location FROM avail ORDER BY name ASC, SKU ASC",
+    "avail_list_versions": "SELECT name, SKU, location, version FROM avail ORDER BY name ASC, SKU ASC",
+    "avail_delete": "DELETE FROM avail WHERE SKU = ?",
+    "avail_clear": "DELETE FROM avail",
+    "students_all": "SELECT stu_ID, stu_name FROM students",
+    "students_list": "SELECT stu_name, stu_ID FROM students ORDER BY stu_name ASC",
+    "students_upsert": """INSERT INTO students (stu_ID, stu_name) VALUES (?, ?)
+        ON CONFLICT (stu_ID) DO UPDATE SET stu_name = excluded.stu_name""",
+    "students_delete": "DELETE FROM students WHERE stu_ID = ?",
+    "student_changes_insert": """INSERT INTO student_changes (date, stu_ID, change, old_name, new_name)
+        VALUES (?, ?, ?, ?, ?)""",
+
+    # Availability change feed
+    "data_version": "PRAGMA data_version",
+    "avail_last_change": "SELECT COALESCE(MAX(seq), 0) FROM avail_changes",
+    "avail_first_change": "SELECT COALESCE(MIN(seq), 0) FROM avail_changes",
+    "catalog_last_change": "SELECT COALESCE(MAX(seq), 0) FROM catalog_changes",
+    "avail_changed": """SELECT avail.name, avail_changes.SKU, avail.location, MAX(avail_changes.seq)
+        FROM avail_changes LEFT JOIN avail ON avail.SKU = avail_changes.SKU
+        WHERE avail_changes.seq > ? GROUP BY avail_changes.SKU""",
+    "avail_changed_versions": """SELECT avail_changes.SKU, avail.location, avail.version, MAX(avail_changes.seq)
+        FROM avail_changes LEFT JOIN avail ON avail.SKU = avail_changes.SKU
+        WHERE avail_changes.seq > ? GROUP BY avail_changes.SKU""",
+
+    # Availability search
+    "avail_search": """SELECT avail.name, avail.SKU, avail.location FROM equipment_search
+        JOIN avail ON avail.SKU = equipment_search.SKU
+        WHERE equipment_search MATCH ?
+        ORDER BY avail.name ASC, avail.SKU ASC LIMIT ?""",
+    "avail_search_prefix": """SELECT name, SKU, location FROM avail
+        WHERE name LIKE ? ESCAPE '\\' OR SKU LIKE ? ESCAPE '\\'
+        ORDER BY name ASC, SKU ASC LIMIT ?""",
+
+    # Imports (staging rows belong to the station that ran the import)
+    "import_equipment_list": """SELECT name, SKU, category, kit, kit_parts FROM import_equipment
+        WHERE station = ? ORDER BY SKU ASC""",
+    "import_equipment_insert": """INSERT OR IGNORE INTO import_equipment (station, name, SKU, category, kit, kit_parts)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+    "import_equipment_clear": "DELETE FROM import_equipment WHERE station = ?",
+    "import_students_list": "SELECT stu_name, stu_ID FROM import_students WHERE station = ? ORDER BY stu_name ASC",
+    "import_students_insert": "INSERT INTO import_students (station, stu_ID, stu_name) VALUES (?, ?, ?)",
+    "import_students_clear": "DELETE FROM import_students WHERE station = ?",
+
+    # Event ledger and the avail projection built from it
+    "ledger_insert": """INSERT INTO ledger (date, event, SKU, name, stu_ID, stu_name, location, station, detail)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "projection_apply": """INSERT INTO avail (SKU, name, location, version)
+        SELECT SKU, name, location, version FROM avail_projection WHERE SKU = ?""",
+    "projection_rebuild": """INSERT INTO avail (SKU, name, location, version)
+        SELECT SKU, name, location, version FROM avail_projection""",
+    "projection_drift": """SELECT 'ledger', * FROM (
+            SELECT SKU, name, location, version FROM avail_projection
+            EXCEPT SELECT SKU, name, location, version FROM avail)
+        UNION ALL
+        SELECT 'avail', * FROM (
+            SELECT SKU, name, location, version FROM avail
+            EXCEPT SELECT SKU, name, location, version FROM avail_projection)
+        ORDER BY 2, 1""",
+
+    # Checkout history ([out, in) intervals per SKU; see create_schema)
+    "holding_before": """SELECT SKU, name, stu_ID, stu_name, out_date, in_date FROM holdings
+        WHERE SKU = ? AND out_date <= ? ORDER BY out_date DESC, out_seq DESC LIMIT 1""",
+    "holdings_SKU_between": """SELECT SKU, name, stu_ID, stu_name, out_date, in_date FROM holdings
+        WHERE SKU = ? AND out_date < ? AND out_date >= COALESCE(
+            (SELECT MAX(out_date) FROM holdings WHERE SKU = ? AND out_date <= ?), '')
+        ORDER BY out_date ASC, out_seq ASC""",
+    "holdings_student_between": """SELECT SKU, name, stu_ID, stu_name, out_date, in_date FROM holdings
+        WHERE stu_ID = ? AND in_date > ? AND out_date < ?
+        UNION ALL
+        SELECT SKU, name, stu_ID, stu_name, out_date, in_date FROM holdings
+        WHERE stu_ID = ? AND in_date IS NULL AND out_date < ?
+        ORDER BY 5 ASC, 1 ASC""",
+
+    # Master list (the ledger, newest first)
+    "ledger_first_page": """SELECT seq, SKU, COALESCE(name, ''), COALESCE(stu_ID, ''), COALESCE(stu_name, ''), date,
+        COALESCE(location, ''), event FROM ledger
+        ORDER BY date DESC, seq DESC LIMIT ?""",
+    "ledger_next_page": """SELECT seq, SKU, COALESCE(name, ''), COALESCE(stu_ID, ''), COALESCE(stu_name, ''), date,
+        COALESCE(location, ''), event FROM ledger
+        WHERE (date, seq) < (?, ?)
+        ORDER BY date DESC, seq DESC LIMIT ?""",
+    "ledger_max_seq": "SELECT COALESCE(MAX(seq), 0) FROM ledger",
+    "ledger_newer": """SELECT seq, SKU, COALESCE(name, ''), COALESCE(stu_ID, ''), COALESCE(stu_name, ''), date,
+        COALESCE(location, ''), event FROM ledger
+        WHERE seq > ? ORDER BY seq ASC""",
+}
+
+
+#-----Storage-----#
+class Storage:
+    def __init__(self, data_uri, station=default_station, shared=False):
+
+        self.station = station
+        self.shared = shared
+        self.busy_retries = 0
+        self.con = sql.connect(data_uri, uri=True, timeout=busy_timeout / 1000, cached_statements=len(queries) * 2)
+        self.cur = self.con.cursor()
+        self.stats = {}
+
+        for pragma in (shared_pragmas if shared else local_pragmas) + pragmas:
+            self.cur.execute(pragma)
+
+    def timed(self, name, started):
+
+        stat = self.stats.setdefault(name, [0, 0.0])
+        stat[0] += 1
+        stat[1] += time.perf_counter() - started
+
+    def execute(self, name, params=()):
+
+        started = time.perf_counter()
+        self.cur.execute(queries[name], params)
+        self.timed(name, started)
+        return self.cur
+
+    def executemany(self, name, params):
+
+        started = time.perf_counter()
+        self.cur.executemany(queries[name], params)
+        self.timed(name, started)
+        return self.cur
+
+    def fetchone(self, name, params=()):
+
+        started = time.perf_counter()
+        row = self.cur.execute(queries[name], params).fetchone()
+        self.timed(name, started)
+        return row
+
+    def fetchall(self, name, params=()):
+
+        started = time.perf_counter()
+        rows = self.cur.execute(queries[name], params).fetchall()
+        self.timed(name, started)
+        return rows
+
+    def commit(self):
+
+        started = time.perf_counter()
+        self.con.commit()
+        self.timed("commit", started)
+
+    def write(self, job, *args):
+
+        # Run job(db, *args) as one write transaction and commit it.
+        # BEGIN IMMEDIATE takes the write lock before the job reads anything,
+        # so its checks cannot be overtaken by another station's commit.
+        # busy_timeout already waits for the lock; if the database is still
+        # busy the whole transaction is retried with a growing delay. Any
+        # other failure rolls back before it is raised, so the connection is
+        # never left inside a transaction.
+        for attempt in range(write_retries):
+            try:
+                self.cur.execute("BEGIN IMMEDIATE")
+                result = job(self, *args)
+                self.commit()
+                return result
+            except BaseException as error:
+                if self.con.in_transaction:
+                    self.con.rollback()
+                busy = isinstance(error, sql.OperationalError) and (
+                    getattr(error, "sqlite_errorcode", 0) & 0xff in busy_codes)
+                if not busy or attempt == write_retries - 1:
+                    raise
+                self.busy_retries += 1
+                time.sleep(write_retry_delay * 2 ** attempt)
+
+    def close(self):
+
+        self.con.close()
+
+    def report(self):
+
+        lines = []
+        for name, (calls, seconds) in sorted(self.stats.items(), key=lambda stat: -stat[1][1]):
+            lines.append(f"{name}: {calls} calls, {seconds * 1000:.1f} ms total, {seconds * 1000 / calls:.3f} ms avg")
+        return "\n".join(lines)
+
+    def create_tables(self):
+
+        # The schema is only (re)built when PRAGMA user_version is behind.
+        # Either way startup is one write transaction and one commit, taken
+        # through write() so stations starting together wait for each other
+        # instead of failing on a snapshot another one has just moved past.
+        return self.write(Storage.startup)
+
+    def startup(self):
+
+        cur = self.cur
+        upgraded = cur.execute("PRAGMA user_version").fetchone()[0] != schema_version
+        if upgraded:
+            self.create_schema()
+            cur.execute(f"PRAGMA user_version = {schema_version}")
+
+        #-----Startup Cleanup-----#
+        # Only this station's leftovers; other kiosks may share the database
+        cur.execute("DELETE FROM temp WHERE station = ?", (self.station,))
+        cur.execute("DELETE FROM import_students WHERE station = ?", (self.station,))
+        cur.execute("DELETE FROM import_equipment WHERE station = ?", (self.station,))
+        cur.execute("DELETE FROM avail_changes WHERE seq <= (SELECT MAX(seq) FROM avail_changes) - ?",
+            (avail_change_keep,))
+        cur.execute("DELETE FROM catalog_changes WHERE seq < (SELECT MAX(seq) FROM catalog_changes)")
+
+        return upgraded
+
+    def create_schema(self):
+
+        cur = self.cur
+
+        #-----Temp Data Table-----#
+        # Staging rows only live inside a session commit, so an old
+        # single-station temp table is simply replaced
+        cur.execute("PRAGMA table_info(temp)")
+        if "station" not in [column[1] for column in cur.fetchall()]:
+            cur.execute("DROP TABLE IF EXISTS temp")
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS temp(
+                    station TEXT NOT NULL,
+                    SKU TEXT NOT NULL,
+                    stu_ID INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    version INTEGER,
+                    PRIMARY KEY (station, SKU)
+                    )""")
+
+        #-----Synced Sessions-----#
+        # One row per outbox session applied here, written in the same
+        # transaction as the session, so replaying it again is a no-op
+        cur.execute("""CREATE TABLE IF NOT EXISTS synced_sessions(
+                    session_id TEXT PRIMARY KEY NOT NULL,
+                    station TEXT NOT NULL,
+                    synced TEXT NOT NULL,
+                    conflicts TEXT NOT NULL
+                    ) WITHOUT ROWID""")
+
+        #-----Equipment Info Data Table-----#
+        cur.execute("""CREATE TABLE IF NOT EXISTS equipment(
+                    name TEXT NOT NULL,
+                    SKU TEXT PRIMARY KEY NOT NULL,
+                    category TEXT,
+                    kit TEXT,
+                    kit_parts TEXT
+                    )""")
+
+        #-----Equipment Search Index-----#
+        # Trigram FTS5 index over name, category and SKU, kept in step with
+        # equipment by triggers so any three characters of a name or barcode
+        # match without scanning the table
+        cur.execute("PRAGMA table_info(equipment_search)")
+        fill_search = not cur.fetchall()
+
+        cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS equipment_search USING fts5(
+                    name, category, SKU,
+                    tokenize = 'trigram'
+                    )""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS equipment_search_insert AFTER INSERT ON equipment BEGIN
+                    INSERT INTO equipment_search (rowid, name, category, SKU)
+                    VALUES (new.rowid, new.name, new.category, new.SKU);
+                    END""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS equipment_search_update AFTER UPDATE ON equipment BEGIN
+                    DELETE FROM equipment_search WHERE rowid = old.rowid;
+                    INSERT INTO equipment_search (rowid, name, category, SKU)
+                    VALUES (new.rowid, new.name, new.category, new.SKU);
+                    END""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS equipment_search_delete AFTER DELETE ON equipment BEGIN
+                    DELETE FROM equipment_search WHERE rowid = old.rowid;
+                    END""")
+
+        if fill_search:
+            cur.execute("""INSERT INTO equipment_search (rowid, name, category, SKU)
+                SELECT rowid, name, category, SKU FROM equipment""")
+
+        #-----Kit Membership Table-----#
+        cur.execute("PRAGMA table_info(kit_members)")
+        fill_kit_members = not cur.fetchall()
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS kit_members(
+                    kit_SKU TEXT NOT NULL,
+                    part_SKU TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (kit_SKU, part_SKU)
+                    ) WITHOUT ROWID""")
+        cur.execute("CREATE INDEX IF NOT EXISTS kit_members_part ON kit_members (part_SKU, kit_SKU)")
+
+        if fill_kit_members:
+            cur.execute("SELECT SKU, kit_parts FROM equipment WHERE kit_parts != ''")
+            cur.executemany(queries["kit_members_insert"],
+                [member for SKU, kit_parts in cur.fetchall() for member in kit_member_rows(SKU, kit_parts)])
+
+        #-----Student ID Data Table-----#
+        cur.execute("""CREATE TABLE IF NOT EXISTS students(
+                    stu_ID TEXT PRIMARY KEY NOT NULL,
+                    stu_name TEXT NOT NULL
+                    )""")
+
+        #-----Student Change Journal-----#
+        cur.execute("""CREATE TABLE IF NOT EXISTS student_changes(
+                    date TEXT NOT NULL,
+                    stu_ID TEXT NOT NULL,
+                    change TEXT NOT NULL,
+                    old_name TEXT,
+                    new_name TEXT
+                    )""")
+
+        #-----Availability Data Table-----#
+        cur.execute("PRAGMA table_info(avail)")
+        avail_columns = [column[1] for column in cur.fetchall()]
+        migrate_avail = bool(avail_columns) and "SKU" not in avail_columns
+
+        if migrate_avail:
+            cur.execute("ALTER TABLE avail RENAME TO avail_old")
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS avail(
+                    SKU TEXT PRIMARY KEY NOT NULL,
+                    name TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0
+                    )""")
+
+        # Bumped by every location event; see session_conflicts
+        if avail_columns and "version" not in avail_columns and not migrate_avail:
+            cur.execute("ALTER TABLE avail ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+        if migrate_avail:
+            cur.execute("CREATE INDEX avail_old_name ON avail_old (name)")
+            cur.execute("""INSERT INTO avail (SKU, name, location)
+                SELECT equipment.SKU, equipment.name, COALESCE(
+                    (SELECT avail_old.location FROM avail_old WHERE avail_old.name = equipment.name LIMIT 1), "in")
+                FROM equipment""")
+            cur.execute("DROP TABLE avail_old")
+
+        #-----Availability Change Feed-----#
+        # Every insert, update or delete on avail appends the SKU with a new
+        # sequence number, so a screen that has seen up to seq N only has to
+        # read the rows changed after it. Old entries are trimmed on startup
+        # (see create_tables).
+        cur.execute("""CREATE TABLE IF NOT EXISTS avail_changes(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    SKU TEXT NOT NULL
+                    )""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS avail_changes_insert AFTER INSERT ON avail BEGIN
+                    INSERT INTO avail_changes (SKU) VALUES (new.SKU);
+                    END""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS avail_changes_update AFTER UPDATE ON avail BEGIN
+                    INSERT INTO avail_changes (SKU) VALUES (new.SKU);
+                    END""")
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS avail_changes_delete AFTER DELETE ON avail BEGIN
+                    INSERT INTO avail_changes (SKU) VALUES (old.SKU);
+                    END""")
+
+        #-----Catalog Change Feed-----#
+        # The same for equipment and students, whoever writes them (an admin
+        # screen on any station, or the replica refresh), so a station's
+        # catalog cache can tell when to reload. Only the latest seq matters;
+        # startup trims the rest.
+        cur.execute("""CREATE TABLE IF NOT EXISTS catalog_changes(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tbl TEXT NOT NULL,
+                    key TEXT NOT NULL
+                    )""")
+        for table, key in (("equipment", "SKU"), ("students", "stu_ID")):
+            for action, row in (("insert", "new"), ("update", "new"), ("delete", "old")):
+                cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_changes_{action} AFTER {action.upper()} ON {table} BEGIN
+                    INSERT INTO catalog_changes (tbl, key) VALUES ('{table}', {row}.{key});
+                    END""")
+
+        #-----Event Ledger-----#
+        # Every change to where an item is or what it is gets appended here:
+        #   checkout, checkin     a committed session (location out / in)
+        #   override              Modify Availability (location, or NULL when
+        #                         the row was removed)
+        #   catalog_add           new equipment, location in
+        #   catalog_change        category or kit edited, or renamed (name set
+        #                         only on a rename; no location)
+        #   catalog_remove        equipment deleted, location NULL
+        # avail is the projection of the ledger: per SKU the latest location
+        # event, the latest name, and the number of location events as its
+        # version. Writers update avail in the same transaction as the event,
+        # and avail_projection recomputes it from scratch for rebuilds and
+        # audits.
+        cur.execute("PRAGMA table_info(ledger)")
+        create_ledger = not cur.fetchall()
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS ledger(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    SKU TEXT NOT NULL,
+                    name TEXT,
+                    stu_ID TEXT,
+                    stu_name TEXT,
+                    location TEXT,
+                    station TEXT,
+                    detail TEXT
+                    )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS ledger_date ON ledger (date)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ledger_SKU ON ledger (SKU, seq)")
+        cur.execute("CREATE INDEX IF NOT EXISTS ledger_stu_ID ON ledger (stu_ID, date)")
+
+        cur.execute("""CREATE VIEW IF NOT EXISTS avail_projection AS
+                    SELECT latest.SKU AS SKU,
+                        COALESCE((SELECT named.name FROM ledger AS named
+                            WHERE named.SKU = latest.SKU AND named.name IS NOT NULL
+                            ORDER BY named.seq DESC LIMIT 1), latest.SKU) AS name,
+                        ledger.location AS location,
+                        latest.events AS version
+                    FROM (SELECT SKU, MAX(seq) AS seq, COUNT(*) AS events FROM ledger
+                        WHERE event != 'catalog_change' GROUP BY SKU) AS latest
+                    JOIN ledger ON ledger.seq = latest.seq
+                    WHERE ledger.location IS NOT NULL""")
+
+        # The old master history becomes checkout / checkin events, followed
+        # by one override per avail row so the projection starts out exactly
+        # where avail was
+        if create_ledger:
+            cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'master'")
+            if cur.fetchone():
+                cur.execute("""INSERT INTO ledger (date, event, SKU, name, stu_ID, stu_name, location)
+                    SELECT date, CASE location WHEN 'out' THEN 'checkout' ELSE 'checkin' END,
+                        SKU, name, stu_ID, stu_name, location
+                    FROM master ORDER BY rowid""")
+                cur.execute("DROP TABLE master")
+
+            cur.execute("""INSERT INTO ledger (date, event, SKU, name, location, detail)
+                SELECT datetime('now', 'localtime'), 'override', SKU, name, location, 'ledger migration'
+                FROM avail ORDER BY SKU""")
+            cur.execute("DELETE FROM avail")
+            cur.execute(queries["projection_rebuild"])
+
+        #-----Checkout Intervals-----#
+        # One row per checkout event, closed by the next location event for
+        # the same SKU (a checkin, an override to anything but out, a removal
+        # or, defensively, another checkout). An item is held by stu_ID over
+        # [out_date, in_date); in_date is NULL while it is still out. The
+        # trigger keeps this in step with every ledger insert, and the two
+        # indexes make "who had SKU at T" one seek and "what did a student
+        # hold between A and B" a range read.
+        cur.execute("PRAGMA table_info(holdings)")
+        fill_holdings = not cur.fetchall()
+
+        cur.execute("""CREATE TABLE IF NOT EXISTS holdings(
+                    out_seq INTEGER PRIMARY KEY NOT NULL,
+                    SKU TEXT NOT NULL,
+                    name TEXT,
+                    stu_ID TEXT,
+                    stu_name TEXT,
+                    out_date TEXT NOT NULL,
+                    in_seq INTEGER,
+                    in_date TEXT
+                    )""")
+        cur.execute("CREATE INDEX IF NOT EXISTS holdings_SKU ON holdings (SKU, out_date)")
+        cur.execute("CREATE INDEX IF NOT EXISTS holdings_stu_ID ON holdings (stu_ID, in_date)")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS holdings_open ON holdings (SKU) WHERE in_seq IS NULL")
+
+        cur.execute("""CREATE TRIGGER IF NOT EXISTS holdings_update AFTER INSERT ON ledger
+                    WHEN new.event != 'catalog_change' BEGIN
+                    UPDATE holdings SET in_seq = new.seq, in_date = new.date
+                    WHERE SKU = new.SKU AND in_seq IS NULL
+                        AND (new.location IS NOT 'out' OR new.event = 'checkout');
+                    INSERT INTO holdings (out_seq, SKU, name, stu_ID, stu_name, out_date)
+                    SELECT new.seq, new.SKU, new.name, new.stu_ID, new.stu_name, new.date
+                    WHERE new.event = 'checkout';
+                    END""")
+
+        if fill_holdings:
+            cur.execute("""INSERT INTO holdings (out_seq, SKU, name, stu_ID, stu_name, out_date, in_seq, in_date)
+                SELECT checkout.seq, checkout.SKU, checkout.name, checkout.stu_ID, checkout.stu_name, checkout.date,
+                    closing.seq, closing.date
+                FROM ledger AS checkout
+                LEFT JOIN ledger AS closing ON closing.seq = (
+                    SELECT MIN(later.seq) FROM ledger AS later
+                    WHERE later.SKU = checkout.SKU AND later.seq > checkout.seq
+                        AND later.event != 'catalog_change'
+                        AND (later.location IS NOT 'out' OR later.event = 'checkout'))
+                WHERE checkout.event = 'checkout'""")
+
+        #-----Import Tables-----#
+        # Staging rows per station, like temp, so one station's import is
+        # never emptied by another starting up; old unkeyed tables are
+        # simply replaced
+        for table in ("import_students", "import_equipment"):
+            cur.execute(f"PRAGMA table_info({table})")
+            if "station" not in [column[1] for column in cur.fetchall()]:
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
+
+        #-----Student ID Import Table-----#
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_students(
+                    station TEXT NOT NULL,
+                    stu_ID TEXT NOT NULL,
+                    stu_name TEXT NOT NULL,
+                    PRIMARY KEY (station, stu_ID)
+                    )""")
+
+        #-----Equipment Import Table-----#
+        cur.execute("""CREATE TABLE IF NOT EXISTS import_equipment(
+                    station TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    SKU TEXT NOT NULL,
+                    category TEXT,
+                    kit TEXT,
+                    kit_parts TEXT,
+                    PRIMARY KEY (station, SKU)
+                    )""")
@@ -0,0 +1,196 @@
+import tkinter.font as tkfont
+from collections import Counter
+from difflib import SequenceMatcher
+
+# Same padding tksheet adds when it sizes a column to its text
+cell_padding = 7
+text_width_cache_size = 20000
+
+#-----Sheet Table-----#
+# One tksheet.Sheet per frame, kept for the life of the app. refresh() lines
+# the new result set up against what the sheet currently shows by row key
+# and only deletes, inserts or rewrites the rows that differ, so reopening a
+# screen after a checkout touches a handful of cells instead of the grid.
+#
+# Column widths come from a per-column count of text widths that is updated
+# with those same row changes. Only new text is ever measured, so laying out
+# a large table no longer means measuring every cell on every open. Edits
+# made in an editable sheet are counted again from the sheet's data.
+
+class SheetTable:
+    def __init__(self, parent, headers, key_column, editable=False, width=760, height=410):
+
+        from tksheet import Sheet
+
+        self.key_column = key_column
+        self.sheet = Sheet(parent,
+                           data=[],
+                           headers=headers,
+                           width=width,
+                           height=height,
+                           theme="dark blue")
+
+        if editable:
+            self.sheet.enable_bindings()
+            self.sheet.bind("<<SheetModified>>", self.sheet_modified)
+        else:
+            self.sheet.disable_bindings()
+
+        self.table_font = tkfont.Font(font=self.sheet.font())
+        header_font = tkfont.Font(font=self.sheet.header_font())
+
+        self.text_widths = {}
+        self.width_counts = [Counter() for _ in headers]
+        self.header_widths = [header_font.measure(str(header)) + cell_padding for header in headers]
+        self.column_widths = None
+
+    def row_key(self, row):
+
+        return row[self.key_column] if len(row) > self.key_column else None
+
+    def text_width(self, value):
+
+        text = "" if value is None else str(value)
+        width = self.text_widths.get(text)
+
+        if width is None:
+            if len(self.text_widths) >= text_width_cache_size:
+                self.text_widths.clear()
+            width = self.text_widths[text] = self.table_font.measure(text) + cell_padding if text else 0
+
+        return width
+
+    def count_row(self, row, step):
+
+        for counts, value in zip(self.width_counts, row):
+            width = self.text_width(value)
+            if step < 0 and counts[width] <= 0:
+                continue
+            counts[width] += step
+            if counts[width] <= 0:
+                del counts[width]
+
+    def recount(self):
+
+        self.width_counts = [Counter() for _ in self.header_widths]
+        for row in self.sheet.data:
+            self.count_row(row, 1)
+
+    def sheet_modified(self, event):
+
+        # Edits, pastes, row inserts and deletes made in the sheet itself, and
+        # their undo/redo, bypass the row methods below, so count again from
+        # what the sheet now holds
+        self.recount()
+        self.apply_layout()
+
+    def apply_layout(self):
+
+        widths = [max(max(counts, default=0), header_width)
+            for counts, header_width in zip(self.width_counts, self.header_widths)]
+
+        if widths != self.column_widths:
+            self.column_widths = widths
+            self.sheet.set_column_widths(widths)
+
+    def insert_rows(self, rows, idx=None):
+
+        rows = [list(row) for row in rows]
+        if not rows:
+            return 0
+
+        if self.sheet.data:
+            self.sheet.insert_rows(rows, idx=idx, undo=False, create_selections=False, redraw=False)
+        else:
+            self.sheet.set_sheet_data(rows, redraw=False)
+            self.column_widths = None
+
+        for row in rows:
+            self.count_row(row, 1)
+
+        self.apply_layout()
+        self.sheet.redraw()
+        return len(rows)
+
+    def patch_rows(self, rows, columns):
+
+        # Rewrite the given columns of rows already on the sheet, found by
+        # key. Rows that are not shown, or that differ in any other column,
+        # are returned for the caller to handle with a full refresh.
+        index = {self.row_key(row): r for r, row in enumerate(self.sheet.data)}
+        unpatched = []
+        changed = 0
+
+        for row in rows:
+            row = list(row)
+            r = index.get(self.row_key(row))
+            old_row = list(self.sheet.data[r]) if r is not None else None
+
+            if old_row is None or len(old_row) != len(row) or any(
+                    old_row[c] != row[c] for c in range(len(row)) if c not in columns):
+                unpatched.append(row)
+                continue
+
+            if old_row == row:
+                continue
+
+            for c in columns:
+                if old_row[c] != row[c]:
+                    self.sheet.set_cell_data(r, c, row[c], redraw=False)
+            self.count_row(old_row, -1)
+            self.count_row(row, 1)
+            changed += 1
+
+        if changed:
+            self.apply_layout()
+            self.sheet.redraw()
+
+        return unpatched
+
+    def refresh(self, rows):
+
+        rows = [list(row) for row in rows]
+        current = [list(row) for row in self.sheet.data]
+
+        if not current:
+            return self.insert_rows(rows)
+
+        old_keys = [self.row_key(row) for row in current]
+        new_keys = [self.row_key(row) for row in rows]
+        opcodes = SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes()
+
+        # Work from the bottom up so the row indexes of earlier blocks stay valid
+        changed = 0
+        for tag, i1, i2, j1, j2 in reversed(opcodes):
+
+            if tag == "equal":
+                for offset in range(i2 - i1):
+                    old_row = current[i1 + offset]
+                    new_row = rows[j1 + offset]
+                    if old_row == new_row:
+                        continue
+
+                    for c, value in enumerate(new_row):
+                        if c >= len(old_row) or old_row[c] != value:
+                            self.sheet.set_cell_data(i1 + offset, c, value, redraw=False)
+                    self.count_row(old_row, -1)
+                    self.count_row(new_row, 1)
+                    changed += 1
+
+            else:
+                if i2 > i1:
+                    self.sheet.del_rows(range(i1, i2), undo=False, redraw=False)
+                    for row in current[i1:i2]:
+                        self.count_row(row, -1)
+                    changed += i2 - i1
+                if j2 > j1:
+                    self.sheet.insert_rows(rows[j1:j2], idx=i1, undo=False, create_selections=False, redraw=False)
+                    for row in rows[j1:j2]:
+                        self.count_row(row, 1)
+                    changed += j2 - j1
+
+        if changed:
+            self.apply_layout()
+            self.sheet.redraw()
+
+        return changed